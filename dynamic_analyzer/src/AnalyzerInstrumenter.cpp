@@ -13,6 +13,7 @@
 
 #include <sstream>
 #include <string>
+#include <vector>
 #include <regex>
 #include <iostream>
 
@@ -24,6 +25,28 @@ namespace analyzer {
 
 namespace {
 
+static TraceFormat trace_format = TraceFormat::Text;
+
+/* record kinds of the binary trace, keep in sync with synthesizer/runtime_trace.py */
+constexpr int TRACE_INST = 1;
+constexpr int TRACE_PTR = 2;
+constexpr int TRACE_MEM = 3;
+constexpr int TRACE_GLOBAL = 4;
+constexpr int TRACE_LOCAL = 5;
+constexpr int TRACE_INT = 6;
+constexpr int TRACE_INST_HIT = 7;
+constexpr int TRACE_MEM_LOCAL = 8;
+constexpr int TRACE_LHS_UNSIGNED = 0x100;
+constexpr int TRACE_RHS_UNSIGNED = 0x200;
+constexpr int TRACE_CHANGED = 0x400;
+
+// a call to the binary trace runtime emitted by AddGlobalMacro
+std::string traceRecord(int kind, const std::string &id_str,
+                        const std::string &a = "0", const std::string &b = "0") {
+    return "__ubgen_trace(" + std::to_string(kind) + "," + id_str +
+           ",(unsigned long long)(" + a + "),(unsigned long long)(" + b + "));";
+}
+
 /* Self-defined computations/actions */
 
 class InstrumentSiteAction : public MatchComputation<std::string> {
@@ -181,7 +204,10 @@ class LogInstrumentSiteAction : public MatchComputation<std::string> {
         std::string id_str = std::to_string(instr_id);
         Result->append("\n/*I:ID" + id_str + ":INSERTIONSITE:*/");
         Result->append("if (print_flag_inst[" + id_str+"]!=2) {");
-        Result->append("printf(\"INST:" + id_str +"\\n\");");
+        if (trace_format != TraceFormat::Text)
+            Result->append(traceRecord(TRACE_INST, id_str));
+        else
+            Result->append("printf(\"INST:" + id_str +"\\n\");");
         Result->append("print_flag_inst["+id_str + "]++;");
         Result->append("}\n");
         instr_id++;
@@ -345,7 +371,10 @@ class LogVarPointerAction : public MatchComputation<std::string> {
         Result->append(expr);
         Result->append(":*/");
         Result->append("if (print_flag_ptr[" + id_str+"]!=2) {");
-        Result->append("printf(\"PTR:" + id_str + ":%p" +"\\n\"," + expr +");");
+        if (trace_format != TraceFormat::Text)
+            Result->append(traceRecord(TRACE_PTR, id_str, expr));
+        else
+            Result->append("printf(\"PTR:" + id_str + ":%p" +"\\n\"," + expr +");");
         Result->append("print_flag_ptr["+id_str + "]++;");
         Result->append("}\n");
         instr_id++;
@@ -468,7 +497,10 @@ class LogVarMemoryAction : public MatchComputation<std::string> {
         Result->append(":VARREF_MEMORY:");
         Result->append(typeStr + ":" + exprStr + ":*/");
         Result->append("if (print_flag_mem[" + id_str+"]!=2) {");
-        Result->append("printf(\"MEM:" + id_str + ":%p:%p\\n\"," + expr_address + "," + "(" + expr_address + ")+1" + ");");
+        if (trace_format != TraceFormat::Text)
+            Result->append(traceRecord(TRACE_MEM, id_str, expr_address, "(" + expr_address + ")+1"));
+        else
+            Result->append("printf(\"MEM:" + id_str + ":%p:%p\\n\"," + expr_address + "," + "(" + expr_address + ")+1" + ");");
         Result->append("print_flag_mem["+id_str + "]++;");
         Result->append("}\n");
         instr_id++;
@@ -533,7 +565,10 @@ class LogVarDeclMemoryAction : public MatchComputation<std::string> {
         Result->append(var->getNameAsString());
         Result->append(":*/");
         Result->append("if (!print_flag_var[" + id_str+"]) {");
-        Result->append("printf(\""+var_scope+":" + id_str + ":%p:%d\\n\"," + var_address + ",sizeof(" + typeStr + "));");
+        if (trace_format != TraceFormat::Text)
+            Result->append(traceRecord(is_global ? TRACE_GLOBAL : TRACE_LOCAL, id_str, var_address, "sizeof(" + typeStr + ")"));
+        else
+            Result->append("printf(\""+var_scope+":" + id_str + ":%p:%d\\n\"," + var_address + ",sizeof(" + typeStr + "));");
         // Result->append("print_flag_var["+id_str + "]=1;"); // one local variable may be re-allocated when call the function more than once.
         Result->append("}\n");
         instr_id++;
@@ -772,7 +807,16 @@ public:
             rhs_str = "(unsigned long long)" + rhs_str;
         }
         Result->append("if (print_flag_int[" + id_str+"]!=2) {");
-        Result->append("printf(\"INT:" + id_str +":" + lhs_type_print + ":" + rhs_type_print + "\\n\"," + lhs_str + "," + rhs_str + ");");
+        if (trace_format != TraceFormat::Text) {
+            int kind = TRACE_INT;
+            if (lhs_type_print == "%llu")
+                kind |= TRACE_LHS_UNSIGNED;
+            if (rhs_type_print == "%llu")
+                kind |= TRACE_RHS_UNSIGNED;
+            Result->append(traceRecord(kind, id_str, lhs_str, rhs_str));
+        } else {
+            Result->append("printf(\"INT:" + id_str +":" + lhs_type_print + ":" + rhs_type_print + "\\n\"," + lhs_str + "," + rhs_str + ");");
+        }
         Result->append("print_flag_int["+id_str + "]++;");
         Result->append("}\n");
         instr_id++;
@@ -882,6 +926,112 @@ auto LogInitBranchRule() {
             });
 }
 
+// Prefix each line of a runtime with /*I::*/ so that clean_instrument drops it.
+std::string instrumentOnlyLines(const std::vector<std::string> &Lines) {
+    std::string Result;
+    for (const auto &Line : Lines)
+        Result += "/*I::*/ " + Line + "\n";
+    return Result;
+}
+
+// TraceFormat::Binary: every event is one 24-byte record,
+// int kind, int id, and two 64-bit payloads. The program aborts after
+// $UBGEN_TRACE_LIMIT records, if set, instead of running into the timeout.
+std::string binaryTraceRuntime() {
+    return instrumentOnlyLines({
+        "#include <stdio.h>",
+        "#include <stdlib.h>",
+        "struct __ubgen_record { int kind; int id; unsigned long long a; unsigned long long b; };",
+        "static FILE *__ubgen_trace_file;",
+        "static unsigned long long __ubgen_trace_limit, __ubgen_trace_count;",
+        "static void __ubgen_trace(int kind, int id, unsigned long long a, unsigned long long b) {"
+        " struct __ubgen_record r;"
+        " if (!__ubgen_trace_file) {"
+        " const char *path = getenv(\"UBGEN_TRACE\"), *limit = getenv(\"UBGEN_TRACE_LIMIT\");"
+        " __ubgen_trace_file = fopen(path ? path : \"ubgen.trace\", \"wb\"); if (!__ubgen_trace_file) abort();"
+        " __ubgen_trace_limit = limit ? strtoull(limit, 0, 10) : 0; }"
+        " if (__ubgen_trace_limit && __ubgen_trace_count++ >= __ubgen_trace_limit) { fclose(__ubgen_trace_file); abort(); }"
+        " r.kind = kind; r.id = id; r.a = a; r.b = b;"
+        " fwrite(&r, sizeof(r), 1, __ubgen_trace_file); }",
+    });
+}
+
+// TraceFormat::Summary: the same __ubgen_trace calls update per-site state in
+// static arrays, which is written as binary records once at exit:
+//   TRACE_INST_HIT  per hit, a: sequence number of the hit
+//   TRACE_INT       last lhs/rhs, TRACE_CHANGED if they changed between hits
+//   TRACE_PTR       once per non-NULL hit with the last value
+//   TRACE_GLOBAL    per global, in order of first registration
+//   TRACE_MEM       last access, TRACE_CHANGED if its address changed between hits,
+//                   followed by TRACE_MEM_LOCAL with the newest local object
+//                   that contained it, if any
+// Locals are only kept to resolve MEM accesses; re-registering an object moves
+// it to the end of the list instead of growing it.
+std::string summaryTraceRuntime() {
+    std::string NInst = std::to_string(LogInstrumentSiteAction::instr_id + 1);
+    std::string NInt = std::to_string(LogIntegerOpAction::instr_id + 1);
+    std::string NPtr = std::to_string(LogVarPointerAction::instr_id + 1);
+    std::string NMem = std::to_string(LogVarMemoryAction::instr_id + 1);
+    std::string NVar = std::to_string(LogVarDeclMemoryAction::instr_id + 1);
+    auto K = [](int Kind) { return std::to_string(Kind); };
+    return instrumentOnlyLines({
+        "#include <stdio.h>",
+        "#include <stdlib.h>",
+        "#include <string.h>",
+        "typedef unsigned long long __ubgen_u64;",
+        "static __ubgen_u64 __ubgen_seq, __ubgen_inst_seq[" + NInst + "][2];",
+        "static int __ubgen_int_state[" + NInt + "]; static __ubgen_u64 __ubgen_int_val[" + NInt + "][2];",
+        "static int __ubgen_ptr_count[" + NPtr + "]; static __ubgen_u64 __ubgen_ptr_val[" + NPtr + "];",
+        "static int __ubgen_mem_state[" + NMem + "]; static __ubgen_u64 __ubgen_mem_val[" + NMem + "][4];",
+        "static int __ubgen_var_seen[" + NVar + "], __ubgen_num_globals; static __ubgen_u64 __ubgen_globals[" + NVar + "][3];",
+        "static __ubgen_u64 (*__ubgen_locals)[2]; static int __ubgen_num_locals, __ubgen_cap_locals, __ubgen_registered;",
+        "static void __ubgen_write(FILE *f, int kind, int id, __ubgen_u64 a, __ubgen_u64 b) {"
+        " struct { int kind; int id; __ubgen_u64 a; __ubgen_u64 b; } r;"
+        " r.kind = kind; r.id = id; r.a = a; r.b = b; fwrite(&r, sizeof(r), 1, f); }",
+        "static void __ubgen_dump(void) {"
+        " const char *path = getenv(\"UBGEN_TRACE\"); FILE *f = fopen(path ? path : \"ubgen.trace\", \"wb\"); int i, j;"
+        " if (!f) return;"
+        " for (i = 0; i < " + NInst + "; i++) for (j = 0; j < 2; j++) if (__ubgen_inst_seq[i][j]) __ubgen_write(f, " + K(TRACE_INST_HIT) + ", i, __ubgen_inst_seq[i][j], 0);"
+        " for (i = 0; i < " + NInt + "; i++) if (__ubgen_int_state[i]) __ubgen_write(f, __ubgen_int_state[i], i, __ubgen_int_val[i][0], __ubgen_int_val[i][1]);"
+        " for (i = 0; i < " + NPtr + "; i++) for (j = 0; j < __ubgen_ptr_count[i]; j++) __ubgen_write(f, " + K(TRACE_PTR) + ", i, __ubgen_ptr_val[i], 0);"
+        " for (i = 0; i < __ubgen_num_globals; i++) __ubgen_write(f, " + K(TRACE_GLOBAL) + ", (int)__ubgen_globals[i][0], __ubgen_globals[i][1], __ubgen_globals[i][2]);"
+        " for (i = 0; i < " + NMem + "; i++) if (__ubgen_mem_state[i]) {"
+        " __ubgen_write(f, __ubgen_mem_state[i], i, __ubgen_mem_val[i][0], __ubgen_mem_val[i][1]);"
+        " if (__ubgen_mem_val[i][3]) __ubgen_write(f, " + K(TRACE_MEM_LOCAL) + ", i, __ubgen_mem_val[i][2], __ubgen_mem_val[i][3]); }"
+        " fclose(f); }",
+        "static void __ubgen_add_local(__ubgen_u64 a, __ubgen_u64 b) {"
+        " int i = __ubgen_num_locals - 1;"
+        " while (i >= 0 && (__ubgen_locals[i][0] != a || __ubgen_locals[i][1] != b)) i--;"
+        " if (i >= 0 && i == __ubgen_num_locals - 1) return;"
+        " if (i >= 0) { memmove(__ubgen_locals[i], __ubgen_locals[i + 1], (__ubgen_num_locals - i - 1) * sizeof(__ubgen_locals[0])); __ubgen_num_locals--; }"
+        " else if (__ubgen_num_locals == __ubgen_cap_locals) {"
+        " __ubgen_cap_locals = __ubgen_cap_locals ? 2 * __ubgen_cap_locals : 1024;"
+        " __ubgen_locals = realloc(__ubgen_locals, __ubgen_cap_locals * sizeof(__ubgen_locals[0])); if (!__ubgen_locals) abort(); }"
+        " __ubgen_locals[__ubgen_num_locals][0] = a; __ubgen_locals[__ubgen_num_locals][1] = b; __ubgen_num_locals++; }",
+        "static void __ubgen_trace(int kind, int id, __ubgen_u64 a, __ubgen_u64 b) {"
+        " int i;"
+        " if (!__ubgen_registered) { __ubgen_registered = 1; atexit(__ubgen_dump); }"
+        " switch (kind & 0xff) {"
+        " case " + K(TRACE_INST) + ": __ubgen_seq++;"
+        " if (!__ubgen_inst_seq[id][0]) __ubgen_inst_seq[id][0] = __ubgen_seq; else if (!__ubgen_inst_seq[id][1]) __ubgen_inst_seq[id][1] = __ubgen_seq; break;"
+        " case " + K(TRACE_INT) + ":"
+        " if (__ubgen_int_state[id] && (__ubgen_int_val[id][0] != a || __ubgen_int_val[id][1] != b)) __ubgen_int_state[id] |= " + K(TRACE_CHANGED) + ";"
+        " __ubgen_int_state[id] |= kind; __ubgen_int_val[id][0] = a; __ubgen_int_val[id][1] = b; break;"
+        " case " + K(TRACE_PTR) + ": if (a) { __ubgen_ptr_val[id] = a; __ubgen_ptr_count[id]++; } break;"
+        " case " + K(TRACE_GLOBAL) + ":"
+        " if (!__ubgen_var_seen[id]) { __ubgen_var_seen[id] = 1; __ubgen_globals[__ubgen_num_globals][0] = id; __ubgen_globals[__ubgen_num_globals][1] = a; __ubgen_globals[__ubgen_num_globals][2] = b; __ubgen_num_globals++; } break;"
+        " case " + K(TRACE_LOCAL) + ": __ubgen_add_local(a, b); break;"
+        " case " + K(TRACE_MEM) + ":"
+        " if (__ubgen_mem_state[id] && __ubgen_mem_val[id][0] != a) __ubgen_mem_state[id] |= " + K(TRACE_CHANGED) + ";"
+        " __ubgen_mem_state[id] |= " + K(TRACE_MEM) + ";"
+        " __ubgen_mem_val[id][0] = a; __ubgen_mem_val[id][1] = b; __ubgen_mem_val[id][2] = 0; __ubgen_mem_val[id][3] = 0;"
+        " for (i = __ubgen_num_locals - 1; i >= 0; i--)"
+        " if (__ubgen_locals[i][0] <= a && b <= __ubgen_locals[i][0] + __ubgen_locals[i][1]) {" // b = a + access size; no unsigned wrap for locals smaller than the access
+        " __ubgen_mem_val[id][2] = __ubgen_locals[i][0]; __ubgen_mem_val[id][3] = __ubgen_locals[i][1]; break; }"
+        " break; } }",
+    });
+}
+
 /* 
     AddGlobalMacro
 */
@@ -895,6 +1045,10 @@ class AddGlobalMacro : public MatchComputation<std::string> {
         Result->append("/*I::*/ int print_flag_mem[" + std::to_string(LogVarMemoryAction::instr_id) + "];\n");
         Result->append("/*I::*/ int print_flag_var[" + std::to_string(LogVarDeclMemoryAction::instr_id) + "];\n");
         Result->append("/*I::*/ int print_flag_ptr[" + std::to_string(LogVarPointerAction::instr_id) + "];\n");
+        if (trace_format == TraceFormat::Binary)
+            Result->append(binaryTraceRuntime());
+        else if (trace_format == TraceFormat::Summary)
+            Result->append(summaryTraceRuntime());
         return llvm::Error::success();
     }
 
@@ -935,8 +1089,10 @@ auto allRules() {
 } // namespace
 
 AnalyzerInstrumenter::AnalyzerInstrumenter(
-    std::map<std::string, clang::tooling::Replacements> &FileToReplacements, ToolMode mode)
+    std::map<std::string, clang::tooling::Replacements> &FileToReplacements, ToolMode mode,
+    TraceFormat trace)
     :  FileToReplacements{FileToReplacements} {
+    trace_format = trace;
 
     Callbacks.emplace_back(ruleactioncallback::RuleActionCallback{
           logBracesRule(), FileToReplacements, FileToNumberValueTrackers});
@@ -997,5 +1153,22 @@ void AnalyzerInstrumenter::registerMatchers(clang::ast_matchers::MatchFinder &Fi
         Callback.registerMatchers(Finder);
 }
 
+void AnalyzerInstrumenter::resetIds() {
+    InstrumentSiteAction::instr_id = 0;
+    LocalVarAction::instr_id = 0;
+    LogBraceAction::instr_id = 0;
+    LogInstrumentSiteAction::instr_id = 0;
+    LogFuncEntAction::instr_id = 0;
+    LogVarDeclAction::instr_id = 0;
+    LogVarArrayAction::instr_id = 0;
+    LogVarPointerAction::instr_id = 0;
+    LogVarMemoryAction::instr_id = 0;
+    LogVarDeclMemoryAction::instr_id = 0;
+    LogVarPointerIndexAction::instr_id = 0;
+    LogIntegerAction::instr_id = 0;
+    LogIntegerOpAction::instr_id = 0;
+    LogInitBranchAction::instr_id = 0;
+}
+
 
 } // namespace analyzer
\ No newline at end of file
@@ -9,15 +9,22 @@
 namespace analyzer {
   
 enum class ToolMode {ArrayPointerIndex, ArrayIndex, PointerIndex, Memory, Pointer, Integer, Divider, Init};
+// Text: one printf line per event. Binary: fixed-width records written to the
+// file named by $UBGEN_TRACE, see synthesizer/runtime_trace.py. Summary: the
+// same records, but per site instead of per event, written at exit.
+enum class TraceFormat {Text, Binary, Summary};
 
 class AnalyzerInstrumenter {
   public:
     AnalyzerInstrumenter(std::map<std::string, clang::tooling::Replacements>
-                    &FileToReplacements, ToolMode mode);
+                    &FileToReplacements, ToolMode mode,
+                    TraceFormat trace = TraceFormat::Text);
     AnalyzerInstrumenter(const AnalyzerInstrumenter &) = delete;
     AnalyzerInstrumenter(AnalyzerInstrumenter &&) = delete;
 
     void registerMatchers(clang::ast_matchers::MatchFinder &Finder);
+    // restart instrumentation ids, e.g., before a new file in one process
+    static void resetIds();
 
 
   private:
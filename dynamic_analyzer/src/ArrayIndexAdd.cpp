@@ -157,5 +157,10 @@ void ArrayIndexAdd::registerMatchers(clang::ast_matchers::MatchFinder &Finder) {
         Callback.registerMatchers(Finder);
 }
 
+void ArrayIndexAdd::resetIds() {
+    ArrayIndexMut::num_mutate = 0;
+    PointerIndexMut::num_mutate = 0;
+}
+
 
 } // namespace analyzer
\ No newline at end of file
@@ -130,5 +130,10 @@ void IntegerAdd::registerMatchers(clang::ast_matchers::MatchFinder &Finder) {
         Callback.registerMatchers(Finder);
 }
 
+void IntegerAdd::resetIds() {
+    IntegerMutLeft::instr_id = 0;
+    IntegerMutRight::instr_id = 0;
+}
+
 
 } // namespace analyzer
\ No newline at end of file
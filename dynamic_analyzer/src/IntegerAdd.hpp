@@ -16,6 +16,8 @@ class IntegerAdd {
     IntegerAdd(IntegerAdd &&) = delete;
 
     void registerMatchers(clang::ast_matchers::MatchFinder &Finder);
+    // restart instrumentation ids, e.g., before a new file in one process
+    static void resetIds();
 
 
   private:
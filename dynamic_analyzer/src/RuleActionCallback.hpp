@@ -1,3 +1,5 @@
+#pragma once
+
 #include <clang/ASTMatchers/ASTMatchers.h>
 #include <clang/Tooling/Transformer/RewriteRule.h>
 #include <clang/Tooling/Transformer/Stencil.h>
@@ -299,5 +299,10 @@ void StackToHeap::registerMatchers(clang::ast_matchers::MatchFinder &Finder) {
         Callback.registerMatchers(Finder);
 }
 
+void StackToHeap::resetIds() {
+    StackToHeapMut::instr_id = 0;
+    FreeHeapMut::instr_id = 0;
+}
+
 
 } // namespace analyzer
\ No newline at end of file
@@ -15,6 +15,8 @@ class StackToHeap {
     StackToHeap(StackToHeap &&) = delete;
 
     void registerMatchers(clang::ast_matchers::MatchFinder &Finder);
+    // restart instrumentation ids, e.g., before a new file in one process
+    static void resetIds();
 
 
   private:
@@ -42,6 +42,17 @@ cl::opt<analyzer::ToolMode>
          cl::init(analyzer::ToolMode::ArrayPointerIndex),
          cl::cat(ToolOptions));
 
+cl::opt<analyzer::TraceFormat>
+    Trace("trace", cl::desc("Format of the runtime trace."),
+          cl::values(clEnumValN(analyzer::TraceFormat::Text, "text",
+                                "printf lines on stdout, the default."),
+                     clEnumValN(analyzer::TraceFormat::Binary, "binary",
+                                "fixed-width records written to $UBGEN_TRACE"),
+                     clEnumValN(analyzer::TraceFormat::Summary, "summary",
+                                "per-site records written to $UBGEN_TRACE at exit")),
+          cl::init(analyzer::TraceFormat::Text),
+          cl::cat(ToolOptions));
+
 bool applyReplacements(RefactoringTool &Tool) {
     LangOptions DefaultLangOptions;
     IntrusiveRefCntPtr<DiagnosticOptions> DiagOpts = new DiagnosticOptions();
@@ -70,7 +81,7 @@ bool applyReplacements(RefactoringTool &Tool) {
 }
 
 template <typename InstrTool> int runToolOnCode(RefactoringTool &Tool) {
-    InstrTool Instr(Tool.getReplacements(), Mode);
+    InstrTool Instr(Tool.getReplacements(), Mode, Trace);
     ast_matchers::MatchFinder Finder;
     Instr.registerMatchers(Finder);
     std::unique_ptr<tooling::FrontendActionFactory> Factory =
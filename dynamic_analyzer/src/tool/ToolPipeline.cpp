@@ -0,0 +1,345 @@
+#include <clang/Frontend/FrontendActions.h>
+#include <clang/Frontend/TextDiagnosticPrinter.h>
+#include <clang/Rewrite/Core/Rewriter.h>
+#include <clang/Tooling/CommonOptionsParser.h>
+#include <clang/Tooling/Refactoring.h>
+
+#include <llvm/ADT/StringSwitch.h>
+#include <llvm/Support/CommandLine.h>
+#include <llvm/Support/FileSystem.h>
+#include <llvm/Support/JSON.h>
+#include <llvm/Support/MemoryBuffer.h>
+#include <llvm/Support/raw_ostream.h>
+#include <type_traits>
+
+#include <AddBraces.hpp>
+#include <AnalyzerInstrumenter.hpp>
+#include <ArrayIndexAdd.hpp>
+#include <IntegerAdd.hpp>
+#include <StackToHeap.hpp>
+
+#include <iostream>
+#include <optional>
+#include <string>
+
+using namespace llvm;
+using namespace clang;
+using namespace clang::tooling;
+using namespace clang::ast_matchers;
+
+/*
+    tool-ubgen-pipeline runs AddBraces, IntegerAdd/ArrayIndexAdd,
+    AnalyzerInstrumenter and StackToHeap in one process. Each pass reparses
+    the output of the previous one from memory and the file is written once.
+
+    With --server, the tool stays alive and reads one JSON request per line
+    from stdin, e.g.,
+        {"file": "/tmp/a.c", "mode": "mem", "integer": false,
+         "arrayindex": true, "stacktoheap": true, "mutate_prob": 0,
+         "trace": "summary"}
+    and answers each with one line, {"ok": true} or {"ok": false, "error": ...}.
+    The compiler arguments after `--` are shared by all requests.
+
+    With --emit-pch=<file>, the given header is precompiled instead, e.g.,
+    csmith.h, so that later runs can pass `-include-pch <file>`. The PCH is
+    built by the clang version linked into this tool, which may differ from
+    the clang driver on PATH.
+*/
+
+namespace {
+
+cl::OptionCategory ToolOptions("options");
+
+cl::opt<bool> AddInteger("integer",
+                         cl::desc("Run IntegerAdd after AddBraces."),
+                         cl::init(false), cl::cat(ToolOptions));
+
+cl::opt<bool> AddArrayIndex("arrayindex",
+                            cl::desc("Run ArrayIndexAdd after AddBraces."),
+                            cl::init(false), cl::cat(ToolOptions));
+
+cl::opt<analyzer::ToolMode>
+    Mode("mode", cl::desc("Instrmentation mode."),
+         cl::values(clEnumValN(analyzer::ToolMode::ArrayPointerIndex, "arrptridx",
+                               "log array and pointer index,"
+                               "The default mode."),
+                    clEnumValN(analyzer::ToolMode::ArrayIndex, "arridx",
+                               "log array index,"),
+                    clEnumValN(analyzer::ToolMode::PointerIndex, "ptridx",
+                               "log pointer index,"),
+                    clEnumValN(analyzer::ToolMode::Memory, "mem",
+                               "log memory"),
+                    clEnumValN(analyzer::ToolMode::Pointer, "ptr",
+                               "log pointer"),
+                    clEnumValN(analyzer::ToolMode::Integer, "int",
+                               "log integer"),
+                    clEnumValN(analyzer::ToolMode::Divider, "zero",
+                               "log divider"),
+                    clEnumValN(analyzer::ToolMode::Init, "init",
+                               "log branch for uninit")),
+         cl::init(analyzer::ToolMode::ArrayPointerIndex),
+         cl::cat(ToolOptions));
+
+cl::opt<analyzer::TraceFormat>
+    Trace("trace", cl::desc("Format of the runtime trace."),
+          cl::values(clEnumValN(analyzer::TraceFormat::Text, "text",
+                                "printf lines on stdout, the default."),
+                     clEnumValN(analyzer::TraceFormat::Binary, "binary",
+                                "fixed-width records written to $UBGEN_TRACE"),
+                     clEnumValN(analyzer::TraceFormat::Summary, "summary",
+                                "per-site records written to $UBGEN_TRACE at exit")),
+          cl::init(analyzer::TraceFormat::Text),
+          cl::cat(ToolOptions));
+
+cl::opt<bool> RunStackToHeap("stacktoheap",
+                             cl::desc("Run StackToHeap after the instrumenter."),
+                             cl::init(false), cl::cat(ToolOptions));
+
+cl::opt<int> MutProb(
+    "mutate-prob",
+    llvm::cl::desc(
+        "the probability (0-100) of mutation in StackToHeap (default=50)"),
+    llvm::cl::cat(ToolOptions),
+    cl::init(50));
+
+cl::opt<bool> Server("server",
+                     cl::desc("Serve JSON requests from stdin until EOF."),
+                     cl::init(false), cl::cat(ToolOptions));
+
+cl::opt<std::string> EmitPch("emit-pch",
+                             cl::desc("Precompile the given header into this file."),
+                             cl::value_desc("filename"), cl::init(""),
+                             cl::cat(ToolOptions));
+
+struct PipelineOptions {
+    bool AddInteger = false;
+    bool AddArrayIndex = false;
+    analyzer::ToolMode Mode = analyzer::ToolMode::ArrayPointerIndex;
+    analyzer::TraceFormat Trace = analyzer::TraceFormat::Text;
+    bool StackToHeap = false;
+    int MutProb = 50;
+};
+
+std::optional<analyzer::ToolMode> parseMode(StringRef Name) {
+    return llvm::StringSwitch<std::optional<analyzer::ToolMode>>(Name)
+        .Case("arrptridx", analyzer::ToolMode::ArrayPointerIndex)
+        .Case("arridx", analyzer::ToolMode::ArrayIndex)
+        .Case("ptridx", analyzer::ToolMode::PointerIndex)
+        .Case("mem", analyzer::ToolMode::Memory)
+        .Case("ptr", analyzer::ToolMode::Pointer)
+        .Case("int", analyzer::ToolMode::Integer)
+        .Case("zero", analyzer::ToolMode::Divider)
+        .Case("init", analyzer::ToolMode::Init)
+        .Default(std::nullopt);
+}
+
+std::optional<analyzer::TraceFormat> parseTrace(StringRef Name) {
+    return llvm::StringSwitch<std::optional<analyzer::TraceFormat>>(Name)
+        .Case("text", analyzer::TraceFormat::Text)
+        .Case("binary", analyzer::TraceFormat::Binary)
+        .Case("summary", analyzer::TraceFormat::Summary)
+        .Default(std::nullopt);
+}
+
+// Run one pass over Code, the in-memory contents of File, and apply its
+// replacements in memory.
+template <typename Pass, typename... PassArgs>
+bool runPass(const CompilationDatabase &Compilations, const std::string &File,
+             std::string &Code, PassArgs... Args) {
+    RefactoringTool Tool(Compilations, {File});
+    Tool.mapVirtualFile(File, Code);
+    Pass P(Tool.getReplacements(), Args...);
+    ast_matchers::MatchFinder Finder;
+    P.registerMatchers(Finder);
+    std::unique_ptr<tooling::FrontendActionFactory> Factory =
+        tooling::newFrontendActionFactory(&Finder);
+
+    if (Tool.run(Factory.get()))
+        return false;
+
+    for (const auto &FileAndReplaces : Tool.getReplacements()) {
+        if (!llvm::sys::fs::equivalent(FileAndReplaces.first, File)) {
+            // the standalone tools would rewrite this file on disk, which we
+            // never want for the csmith headers
+            llvm::errs() << "Skipping replacements outside the main file: "
+                         << FileAndReplaces.first << "\n";
+            continue;
+        }
+        auto NewCode = tooling::applyAllReplacements(Code, FileAndReplaces.second);
+        if (!NewCode) {
+            llvm::errs() << "Failed applying all replacements: "
+                         << llvm::toString(NewCode.takeError()) << "\n";
+            return false;
+        }
+        Code = std::move(*NewCode);
+    }
+    return true;
+}
+
+int runPipelineOnFile(const CompilationDatabase &Compilations,
+                      const std::string &File, const PipelineOptions &Opts,
+                      std::string &Error) {
+    auto Buffer = llvm::MemoryBuffer::getFile(File);
+    if (!Buffer) {
+        Error = "Cannot read " + File + ": " + Buffer.getError().message();
+        return 1;
+    }
+    std::string Code = (*Buffer)->getBuffer().str();
+
+    // every file starts from ID0, as with a fresh process per tool
+    analyzer::IntegerAdd::resetIds();
+    analyzer::ArrayIndexAdd::resetIds();
+    analyzer::AnalyzerInstrumenter::resetIds();
+    analyzer::StackToHeap::resetIds();
+
+    if (!runPass<analyzer::AddBraces>(Compilations, File, Code)) {
+        Error = "AddBraces failed.";
+        return 1;
+    }
+    if (Opts.AddInteger &&
+        !runPass<analyzer::IntegerAdd>(Compilations, File, Code)) {
+        Error = "IntegerAdd failed.";
+        return 1;
+    }
+    if (Opts.AddArrayIndex &&
+        !runPass<analyzer::ArrayIndexAdd>(Compilations, File, Code)) {
+        Error = "ArrayIndexAdd failed.";
+        return 1;
+    }
+    if (!runPass<analyzer::AnalyzerInstrumenter>(Compilations, File, Code,
+                                                 Opts.Mode, Opts.Trace)) {
+        Error = "AnalyzerInstrumenter failed.";
+        return 1;
+    }
+    if (Opts.StackToHeap &&
+        !runPass<analyzer::StackToHeap>(Compilations, File, Code,
+                                        Opts.MutProb)) {
+        Error = "StackToHeap failed.";
+        return 1;
+    }
+
+    std::error_code EC;
+    llvm::raw_fd_ostream OS(File, EC, llvm::sys::fs::OF_None);
+    if (EC) {
+        Error = "Failed to overwrite " + File + ": " + EC.message();
+        return 1;
+    }
+    OS << Code;
+    return 0;
+}
+
+int emitPch(const CompilationDatabase &Compilations,
+            const std::vector<std::string> &Files) {
+    ClangTool Tool(Compilations, Files);
+    // keep the -o we add below instead of the default -fsyntax-only
+    Tool.clearArgumentsAdjusters();
+    Tool.appendArgumentsAdjuster(getClangStripOutputAdjuster());
+    Tool.appendArgumentsAdjuster(getInsertArgumentAdjuster(
+        {"-x", "c-header"}, ArgumentInsertPosition::BEGIN));
+    Tool.appendArgumentsAdjuster(getInsertArgumentAdjuster(
+        {"-o", EmitPch.getValue()}, ArgumentInsertPosition::END));
+    return Tool.run(newFrontendActionFactory<GeneratePCHAction>().get());
+}
+
+// Parse one server request; returns false and sets Error on malformed input.
+bool parseRequest(StringRef Line, std::string &File, PipelineOptions &Opts,
+                  std::string &Error) {
+    auto Request = llvm::json::parse(Line);
+    if (!Request) {
+        Error = llvm::toString(Request.takeError());
+        return false;
+    }
+    const llvm::json::Object *Obj = Request->getAsObject();
+    if (!Obj) {
+        Error = "request is not a JSON object";
+        return false;
+    }
+    auto FileName = Obj->getString("file");
+    if (!FileName) {
+        Error = "request has no file";
+        return false;
+    }
+    File = getAbsolutePath(*FileName);
+    if (auto ModeName = Obj->getString("mode")) {
+        auto M = parseMode(*ModeName);
+        if (!M) {
+            Error = "unknown mode " + ModeName->str();
+            return false;
+        }
+        Opts.Mode = *M;
+    }
+    if (auto TraceName = Obj->getString("trace")) {
+        auto T = parseTrace(*TraceName);
+        if (!T) {
+            Error = "unknown trace format " + TraceName->str();
+            return false;
+        }
+        Opts.Trace = *T;
+    }
+    Opts.AddInteger = Obj->getBoolean("integer").value_or(false);
+    Opts.AddArrayIndex = Obj->getBoolean("arrayindex").value_or(false);
+    Opts.StackToHeap = Obj->getBoolean("stacktoheap").value_or(false);
+    Opts.MutProb = Obj->getInteger("mutate_prob").value_or(50);
+    return true;
+}
+
+int runServer(const CompilationDatabase &Compilations) {
+    std::string Line;
+    while (std::getline(std::cin, Line)) {
+        if (Line.empty())
+            continue;
+        std::string File, Error;
+        PipelineOptions Opts;
+        bool Ok = parseRequest(Line, File, Opts, Error) &&
+                  !runPipelineOnFile(Compilations, File, Opts, Error);
+        llvm::json::Object Reply{{"ok", Ok}};
+        if (!Ok)
+            Reply["error"] = Error;
+        llvm::outs() << llvm::json::Value(std::move(Reply)) << "\n";
+        llvm::outs().flush();
+    }
+    return 0;
+}
+
+} // namespace
+
+int main(int argc, const char **argv) {
+    auto ExpectedParser =
+        CommonOptionsParser::create(argc, argv, ToolOptions, cl::ZeroOrMore);
+    if (!ExpectedParser) {
+        llvm::errs() << ExpectedParser.takeError();
+        return 1;
+    }
+    CommonOptionsParser &OptionsParser = ExpectedParser.get();
+
+    const auto &Compilations = OptionsParser.getCompilations();
+    const auto &Files = OptionsParser.getSourcePathList();
+    if (Server)
+        return runServer(Compilations);
+    if (!EmitPch.empty())
+        return emitPch(Compilations, Files);
+
+    PipelineOptions Opts;
+    Opts.AddInteger = AddInteger;
+    Opts.AddArrayIndex = AddArrayIndex;
+    Opts.Mode = Mode;
+    Opts.Trace = Trace;
+    Opts.StackToHeap = RunStackToHeap;
+    Opts.MutProb = MutProb;
+    int Result = 0;
+    for (const auto &File : Files) {
+        std::string Error;
+        Result = runPipelineOnFile(Compilations, getAbsolutePath(File), Opts, Error);
+        if (Result) {
+            llvm::errs() << Error << "\n";
+            break;
+        }
+    }
+
+    if (Result) {
+        llvm::errs() << "Something went wrong...\n";
+        return Result;
+    }
+
+    return 0;
+}
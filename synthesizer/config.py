@@ -1,4 +1,5 @@
 from enum import Enum, auto
+from dataclasses import dataclass
 import os
 from pathlib import Path
 
@@ -8,11 +9,49 @@ CC = "clang"
 # csmith config
 CSMITH_BIN = f'{Path(__file__).parent.parent}/csmith_install/bin/csmith'
 MIN_PROGRAM_SIZE = 8000 # programs shorter than this many bytes are too boring to test
+MIN_SEED_CONSTRUCTS = 1 # seeds with fewer matches of a construct the target UB needs are rejected before the sanitizer check
 CSMITH_TIMEOUT = 10
 CSMITH_USER_OPTIONS = "--no-packed-struct --ccomp --no-volatiles --no-volatile-pointers"
 CSMITH_CHECK_OPTIONS = "-fsanitize=address,undefined -fno-sanitize-recover=all"
+# extra options tried for seeds of each target UB, by TargetUB name; '' is plain CSMITH_USER_OPTIONS.
+# ubgen.py measures the mutants per second of each and prefers the best one.
+CSMITH_UB_PROFILES = {
+    'BufferOverflow':  ['', '--max-array-dim 3 --max-array-len-per-dim 10', '--no-structs --no-unions --max-funcs 10'],
+    'OutBound':        ['', '--max-array-dim 3 --max-array-len-per-dim 10', '--no-structs --no-unions --max-funcs 10'],
+    'NullPtrDeref':    ['', '--max-pointer-depth 3', '--max-pointer-depth 3 --no-arrays'],
+    'UseAfterScope':   ['', '--max-pointer-depth 3 --max-block-depth 5', '--max-funcs 10 --max-block-size 6'],
+    'UseAfterFree':    ['', '--max-pointer-depth 3 --max-funcs 10', '--no-structs --no-unions --max-block-size 6'],
+    'DoubleFree':      ['', '--max-funcs 10 --max-block-size 6', '--no-structs --no-unions'],
+    'MemoryLeak':      ['', '--max-funcs 10 --max-block-size 6', '--no-structs --no-unions'],
+    'IntegerOverflow': ['', '--max-expr-complexity 10', '--max-expr-complexity 10 --no-pointers'],
+    'DivideZero':      ['', '--max-expr-complexity 10', '--max-expr-complexity 10 --no-pointers'],
+    'UseUninit':       ['', '--max-funcs 10 --max-block-size 6', '--no-structs --no-unions'],
+}
 
-COMPILE_ARGS = f' -I{Path(__file__).parent.parent}/csmith_install/include/csmith-2.3.0 '
+CSMITH_INCLUDE = f'{Path(__file__).parent.parent}/csmith_install/include/csmith-2.3.0'
+CSMITH_PCH_DIR = f'{Path(__file__).parent.parent}/csmith_install/pch' # precompiled csmith.h, built by ubgen.py
+
+def csmith_pch_path(name) -> str:
+    return f'{CSMITH_PCH_DIR}/csmith-{name}.pch'
+
+def csmith_pch_args(name) -> str:
+    """
+    `-include-pch` for the csmith.h precompiled as `name`, or '' if it has not
+    been built yet or is older than the header. A PCH is only accepted by
+    compiles with the same clang and the same flags (e.g., sanitizers), so
+    each kind of compile has its own.
+    """
+    pch = csmith_pch_path(name)
+    header = f'{CSMITH_INCLUDE}/csmith.h'
+    if not os.path.exists(pch) or not os.path.exists(header):
+        return ''
+    if os.path.getmtime(pch) < os.path.getmtime(header):
+        return ''
+    return f' -include-pch {pch} '
+
+INCLUDE_ARGS = f' -I{CSMITH_INCLUDE} ' # for compiles that must not use a PCH, e.g., gcc or other sanitizers
+COMPILE_ARGS = INCLUDE_ARGS + (csmith_pch_args('cc') if 'clang' in CC else '')
+CHECK_COMPILE_ARGS = INCLUDE_ARGS + (csmith_pch_args('check') if 'clang' in CC else '') # with CSMITH_CHECK_OPTIONS
 COMPCERT = "ccomp -interp -fstruct-passing "
 
 # mutated configurations for each seed
@@ -22,6 +61,7 @@ MUTATE_NUM = 2
 # program config
 COMPILER_TIMEOUT = 10
 PROG_TIMEOUT = 2
+INSTRUMENT_TIMEOUT = 10 # per clang-tool pass
 
 # Synthesizer config
 class TargetUB(Enum):
@@ -61,9 +101,34 @@ TOOL_ADDARRAYINDEX = f'{DYNAMIC_ANALYZER}/tool-addarrayindex'
 TOOL_ADDINTEGER = f'{DYNAMIC_ANALYZER}/tool-addinteger'
 TOOL_INSTRUMENTER = f'{DYNAMIC_ANALYZER}/tool-instrumenter'
 TOOL_STACKTOHEAP = f'{DYNAMIC_ANALYZER}/tool-stacktoheap --mutate-prob 0'
+TOOL_PIPELINE = f'{DYNAMIC_ANALYZER}/tool-ubgen-pipeline' # all of the above in one process; used when built
+INSTRUMENT_SERVER = True # keep one TOOL_PIPELINE --server alive per process instead of one process per seed
+TRACE_FORMAT = 'summary' # runtime trace of instrumented programs: per-site 'summary' or per-event 'binary' records in a file, or 'text' printf lines
+TRACE_MAX_BYTES = 256 << 20 # give up on an instrumented run once its trace grows beyond this
+TOOL_COMPILE_ARGS = INCLUDE_ARGS + csmith_pch_args('tool') # the clang tools may link a different clang than CC
 ALL_TARGET_UB = [TargetUB.MemoryLeak]
 
 CONFIG_IntegerOverflow = MutIntegerOverflow.Value # configure this when use TargetUB.IntegerOverflow
 CSMITH_USER_OPTIONS += " --no-safe-math"
 if has_overlap([TargetUB.DoubleFree, TargetUB.MemoryLeak], ALL_TARGET_UB):
     TOOL_STACKTOHEAP = f'{DYNAMIC_ANALYZER}/tool-stacktoheap --mutate-prob 100' # free statements will only be inserted with p=100
+
+@dataclass(frozen=True)
+class SynthesizerConfig:
+    """
+    What one Synthesizer targets, fixed when it is created, so that synthesizers
+    of different UBs can share a process or a pool. Defaults to the settings above.
+    """
+    target_ubs: tuple = tuple(ALL_TARGET_UB)
+    tool_stacktoheap: str = None # None: TOOL_STACKTOHEAP, inserting free statements with p=100 for DoubleFree and MemoryLeak
+    integer_overflow: MutIntegerOverflow = CONFIG_IntegerOverflow
+
+    def __post_init__(self):
+        object.__setattr__(self, 'target_ubs', tuple(self.target_ubs))
+        if len(self.target_ubs) == 0 or TargetUB.ERROR in self.target_ubs:
+            raise ValueError(f'invalid target UBs: {self.target_ubs}')
+        if self.tool_stacktoheap is None:
+            tool = TOOL_STACKTOHEAP
+            if has_overlap([TargetUB.DoubleFree, TargetUB.MemoryLeak], self.target_ubs):
+                tool = f'{DYNAMIC_ANALYZER}/tool-stacktoheap --mutate-prob 100'
+            object.__setattr__(self, 'tool_stacktoheap', tool)
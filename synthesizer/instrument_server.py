@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import os, json, select, threading, atexit
+import subprocess as sp
+
+
+class InstrumentServer:
+    """
+    A long-running `tool-ubgen-pipeline --server` process.
+    Each request and each reply is one JSON line over stdin/stdout, so clang
+    and LLVM are initialized once per process instead of once per tool call.
+    """
+    def __init__(self, cmd) -> None:
+        self.cmd = cmd
+        self.process = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.process = sp.Popen(self.cmd, stdin=sp.PIPE, stdout=sp.PIPE, stderr=sp.DEVNULL, text=True, bufsize=1)
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.kill()
+            self.process.wait()
+        except OSError:
+            pass
+        self.process = None
+
+    def request(self, req, time_out=10):
+        """
+        Instrument one file. Returns (ret, out) as run_cmd does, or None if the
+        server cannot be used so that the caller falls back to subprocesses.
+        """
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                try:
+                    self.start()
+                except OSError:
+                    self.process = None
+                    return None
+            try:
+                self.process.stdin.write(json.dumps(req) + '\n')
+                self.process.stdin.flush()
+                ready, _, _ = select.select([self.process.stdout], [], [], time_out)
+                if not ready:
+                    # stuck on this file; the next request gets a fresh server
+                    self.stop()
+                    return 1, f'timed out after {time_out} seconds'
+                line = self.process.stdout.readline()
+                if not line: # the server died, e.g., clang crashed on this file
+                    self.stop()
+                    return None
+                reply = json.loads(line)
+                if not isinstance(reply, dict):
+                    raise ValueError(f'unexpected reply: {line!r}')
+            except (OSError, ValueError): # ValueError also covers a garbled reply line
+                self.stop()
+                return None
+            if reply.get('ok'):
+                return 0, ''
+            return 1, reply.get('error', '')
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+def get_instrument_server(cmd) -> InstrumentServer:
+    """
+    One server per process and command line; forked workers start their own.
+    """
+    key = (os.getpid(), tuple(cmd))
+    with _servers_lock:
+        if key not in _servers:
+            _servers[key] = InstrumentServer(cmd)
+        return _servers[key]
+
+@atexit.register
+def stop_instrument_servers():
+    for (pid, _), server in list(_servers.items()):
+        if pid == os.getpid():
+            server.stop()
@@ -0,0 +1,242 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import os, sys, json, gzip, struct
+sys.path.append(os.path.dirname(__file__))
+from source_patch import DIGEST_SIZE, Mutant, mutant_digest, materialize, diff_edit, splice
+try:
+    import zstandard # optional, only for zstd packs
+except ImportError:
+    zstandard = None
+
+
+class DigestSet:
+    """
+    Digests of the mutants kept so far, see source_patch.mutant_digest.
+    With a path, the set is loaded from that file and every new digest is
+    appended to it (DIGEST_SIZE bytes each), so it persists across runs.
+    """
+    def __init__(self, path=None) -> None:
+        self.digests = set()
+        self.file = None
+        if path is None:
+            return
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            # a digest cut off by a killed run is dropped
+            for i in range(0, len(data) - len(data) % DIGEST_SIZE, DIGEST_SIZE):
+                self.digests.add(data[i:i+DIGEST_SIZE])
+        self.file = open(path, 'ab')
+
+    def __contains__(self, digest):
+        return digest in self.digests
+
+    def __len__(self):
+        return len(self.digests)
+
+    def add(self, digest) -> bool:
+        """
+        Add a digest; False if it was already there.
+        """
+        if digest in self.digests:
+            return False
+        self.digests.add(digest)
+        if self.file is not None:
+            self.file.write(digest)
+            self.file.flush()
+        return True
+
+    def add_mutant(self, mutant) -> bool:
+        return self.add(mutant_digest(mutant))
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class CorpusStore:
+    """
+    Content-addressed mutant store. A mutant with hex digest d is
+    <root>/<d[:2]>/<d>.c and <root>/index.jsonl gets one line per stored
+    mutant with its digest, path, seed digest and what put() is told about
+    the mutation. Storing a mutant that is already there does nothing, so
+    repeated runs into the same root are idempotent.
+    """
+    INDEX = 'index.jsonl'
+
+    def __init__(self, root) -> None:
+        self.root = str(root)
+        os.makedirs(self.root, exist_ok=True)
+        self.index = open(os.path.join(self.root, self.INDEX), 'a')
+
+    def __str__(self):
+        return self.root
+
+    def path(self, digest_hex) -> str:
+        return os.path.join(self.root, digest_hex[:2], f'{digest_hex}.c')
+
+    def put(self, mutant, digest=None, seed=None, **info) -> bool:
+        """
+        Store a mutant (str, bytes or Mutant); False if it was already stored.
+        """
+        if digest is None:
+            digest = mutant_digest(mutant)
+        mutant = materialize(mutant)
+        digest_hex = digest.hex()
+        path = self.path(digest_hex)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(mutant.encode('utf-8') if isinstance(mutant, str) else mutant)
+        os.replace(tmp_path, path) # readers never see a partial mutant
+        record = {'digest': digest_hex, 'path': os.path.relpath(path, self.root), 'seed': seed}
+        record.update(info)
+        self.index.write(json.dumps(record) + '\n')
+        self.index.flush()
+        return True
+
+    def close(self):
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+def read_index(root):
+    """
+    Iterate over the index records of a CorpusStore; a line cut off by a
+    killed run is skipped.
+    """
+    path = os.path.join(str(root), CorpusStore.INDEX)
+    if not os.path.exists(path):
+        return
+    with open(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+# a pack is a stream of records: PACK_HEADER (kind, meta length, body length),
+# then the JSON meta and the body, both utf-8
+PACK_HEADER = struct.Struct('<BII')
+PACK_BASE = 1 # meta: digest; body: the text mutants are deltas against
+PACK_MUTANT = 2 # meta: digest, seed, ... and base, start, end if a delta; body: the text or the replacement of base[start:end]
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+def pack_compression(path):
+    """
+    Compression of an existing pack: None, 'gzip' or 'zstd'.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if magic == ZSTD_MAGIC:
+        return 'zstd'
+    return None
+
+def open_pack(path, mode, compression):
+    # mode is 'ab' or 'rb'; gzip members and zstd frames can be concatenated, so appending works for all three
+    if compression == 'gzip':
+        return gzip.open(path, mode)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('zstd packs need the `zstandard` module')
+        if mode == 'rb':
+            return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True)
+        return zstandard.ZstdCompressor().stream_writer(open(path, mode))
+    if compression is not None:
+        raise ValueError(f'unknown pack compression: {compression}')
+    return open(path, mode)
+
+
+class PackWriter:
+    """
+    Append-only bundle of mutants in one file, optionally compressed.
+    Mutants put() with their base, e.g., the cleaned seed, are stored as one
+    edit against it and the base is written once per run of mutants sharing it.
+    Appending to an existing pack keeps that pack's compression.
+    """
+    def __init__(self, path, compression=None) -> None:
+        self.path = str(path)
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            compression = pack_compression(self.path)
+        self.file = open_pack(self.path, 'ab', compression)
+        self.base = None
+        self.base_digest = None
+
+    def __str__(self):
+        return self.path
+
+    def write_record(self, kind, meta, body):
+        meta = json.dumps(meta).encode('utf-8')
+        body = body.encode('utf-8')
+        self.file.write(PACK_HEADER.pack(kind, len(meta), len(body)))
+        self.file.write(meta)
+        self.file.write(body)
+
+    def put(self, mutant, digest=None, seed=None, base=None, **info) -> bool:
+        """
+        Append a mutant (str or bytes), as a delta against base (str) if given.
+        A Mutant is always stored as a delta against its own base.
+        """
+        if isinstance(mutant, bytes):
+            mutant = mutant.decode('utf-8')
+        if digest is None:
+            digest = mutant_digest(mutant)
+        meta = {'digest': digest.hex(), 'seed': seed}
+        meta.update(info)
+        body = mutant
+        if isinstance(mutant, Mutant):
+            base = mutant.base
+        if base is not None:
+            if base is not self.base: # mutants of one seed share their base
+                base_digest = mutant_digest(base).hex()
+                if base_digest != self.base_digest:
+                    self.write_record(PACK_BASE, {'digest': base_digest}, base)
+                    self.base_digest = base_digest
+                self.base = base
+            if isinstance(mutant, Mutant):
+                start, end, body = mutant.span_edit()
+            else:
+                start, end, body = diff_edit(base, mutant)
+            meta.update(base=self.base_digest, start=start, end=end)
+        self.write_record(PACK_MUTANT, meta, body)
+        return True
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+def read_pack(path):
+    """
+    Iterate over the mutants of a pack as (meta, text); meta holds what
+    PackWriter.put() was told about the mutant. A record cut off by a killed
+    run ends the iteration.
+    """
+    bases = {} # only the latest base, mutants follow their base
+    with open_pack(str(path), 'rb', pack_compression(path)) as f:
+        while True:
+            try:
+                header = f.read(PACK_HEADER.size)
+                if len(header) < PACK_HEADER.size:
+                    return
+                kind, meta_len, body_len = PACK_HEADER.unpack(header)
+                meta, body = f.read(meta_len), f.read(body_len)
+            except (EOFError, gzip.BadGzipFile): # a truncated gzip member
+                return
+            if len(meta) < meta_len or len(body) < body_len:
+                return
+            meta, body = json.loads(meta), body.decode('utf-8')
+            if kind == PACK_BASE:
+                bases = {meta['digest']: body}
+                continue
+            if 'base' in meta:
+                base = bases[meta.pop('base')]
+                body = splice(base, [(meta.pop('start'), meta.pop('end'), body)])
+            yield meta, body
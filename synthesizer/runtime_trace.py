@@ -0,0 +1,310 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import os, re, threading
+import subprocess as sp
+from bisect import bisect_left, bisect_right, insort
+import numpy as np
+
+# record kinds of the binary trace, keep in sync with AnalyzerInstrumenter.cpp
+TRACE_INST   = 1 # executed instrumentation site
+TRACE_PTR    = 2 # a: pointer value
+TRACE_MEM    = 3 # a: accessed address, b: a + sizeof(*a)
+TRACE_GLOBAL = 4 # a: address of a global, b: its size
+TRACE_LOCAL  = 5 # a: address of a local, b: its size
+TRACE_INT    = 6 # a: lhs, b: rhs, as 64-bit patterns
+TRACE_INST_HIT  = 7 # summary only, a: sequence number of one of the first two hits
+TRACE_MEM_LOCAL = 8 # summary only, a: head, b: size of the local holding the preceding TRACE_MEM
+TRACE_KIND_MASK    = 0xff
+TRACE_LHS_UNSIGNED = 0x100 # flags of TRACE_INT, lhs was printed as %llu
+TRACE_RHS_UNSIGNED = 0x200
+TRACE_CHANGED      = 0x400 # summary only, TRACE_INT/TRACE_MEM changed between hits, the record holds the last one
+
+TRACE_RECORD = np.dtype([('kind', '=i4'), ('id', '=i4'), ('a', '=u8'), ('b', '=u8')])
+
+TEXT_EVENT = re.compile(r'(INST|PTR|MEM|GLOBAL|LOCAL|INT):([\-|\d]+)(?::([\-|\w]+))?(?::([\-|\w]+))?')
+TEXT_KIND = {'INST': TRACE_INST, 'PTR': TRACE_PTR, 'MEM': TRACE_MEM, 'GLOBAL': TRACE_GLOBAL, 'LOCAL': TRACE_LOCAL, 'INT': TRACE_INT}
+
+U64_MASK = (1 << 64) - 1
+CHUNK_RECORDS = 1 << 16 # records converted to Python objects at a time
+
+def to_signed64(v) -> int:
+    return v - (1 << 64) if v >= (1 << 63) else v
+
+def load_binary_trace(path) -> np.ndarray:
+    """
+    Map a binary trace as an array of TRACE_RECORD without copying it.
+    A missing or empty trace gives an empty array and a truncated last record,
+    e.g., from a killed run, is dropped.
+    """
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    num = size // TRACE_RECORD.itemsize
+    if num == 0:
+        return np.empty(0, dtype=TRACE_RECORD)
+    return np.memmap(path, dtype=TRACE_RECORD, mode='r', shape=(num,))
+
+def text_event_to_record(kind_str, id_str, a_str, b_str):
+    """
+    One text event as a (kind, id, a, b) record, or None for events the text
+    regexes never matched, e.g., `PTR:3:(nil)`.
+    """
+    kind = TEXT_KIND[kind_str]
+    if kind == TRACE_INST:
+        return kind, int(id_str), 0, 0
+    if kind == TRACE_PTR:
+        if a_str is None:
+            return None
+        return kind, int(id_str), int(a_str, 16), 0
+    if a_str is None or b_str is None:
+        return None
+    if kind == TRACE_MEM:
+        return kind, int(id_str), int(a_str, 16), int(b_str, 16)
+    if kind in [TRACE_GLOBAL, TRACE_LOCAL]:
+        return kind, int(id_str), int(a_str, 16), int(b_str)
+    lhs, rhs = int(a_str), int(b_str)
+    if lhs >= 0:
+        kind |= TRACE_LHS_UNSIGNED
+    if rhs >= 0:
+        kind |= TRACE_RHS_UNSIGNED
+    return kind, int(id_str), lhs & U64_MASK, rhs & U64_MASK
+
+
+class GlobalRegions:
+    """
+    Interval index over mem_range_global ({head: size}, in order of first
+    registration). find() returns the first registered global that holds an
+    access, the same one a scan over the dict finds.
+    """
+    def __init__(self, mem_range_global) -> None:
+        ranked = sorted((head, size, rank) for rank, (head, size) in enumerate(mem_range_global.items()))
+        self.heads = [head for head, _, _ in ranked]
+        self.regions = ranked
+        self.max_ends = [] # max(head+size) over regions[:i+1], to stop the backward walk early
+        max_end = None
+        for head, size, _ in ranked:
+            max_end = head + size if max_end is None else max(max_end, head + size)
+            self.max_ends.append(max_end)
+
+    def find(self, access_mem, access_size):
+        best = None
+        i = bisect_right(self.heads, access_mem) - 1
+        while i >= 0 and self.max_ends[i] >= access_mem + access_size:
+            head, size, rank = self.regions[i]
+            if head + size >= access_mem + access_size and (best is None or rank < best[2]):
+                best = self.regions[i]
+            i -= 1
+        return None if best is None else best[:2]
+
+
+class LocalRegions:
+    """
+    Interval index over local objects in registration order. find() returns
+    the most recently registered local that holds an access, the same one a
+    backward scan over all registrations finds; only the newest registration
+    of each (head, size) can win, so repeated ones do not grow the index.
+    """
+    def __init__(self) -> None:
+        self.heads = [] # sorted, distinct
+        self.sizes = {} # head: {size: latest registration}
+        self.max_size = 0
+        self.count = 0
+
+    def add(self, head, size):
+        if head not in self.sizes:
+            insort(self.heads, head)
+            self.sizes[head] = {}
+        self.sizes[head][size] = self.count
+        self.max_size = max(self.max_size, size)
+        self.count += 1
+
+    def find(self, access_mem, access_size):
+        best, best_rank = None, -1
+        lo = bisect_left(self.heads, access_mem - self.max_size)
+        hi = bisect_right(self.heads, access_mem)
+        for head in self.heads[lo:hi]:
+            for size, rank in self.sizes[head].items():
+                if head + size >= access_mem + access_size and rank > best_rank:
+                    best, best_rank = (head, size), rank
+        return best
+
+
+class TraceTables:
+    """
+    What Synthesizer.instrument needs from one run of the instrumented program:
+    the executed INST sites in order and, per site ID, the last observed value
+    and whether values differed between executions (`*_repeat`).
+    Events are added in execution order; call finish() after the last one.
+    """
+    def __init__(self, need_int=True, need_ptr=True, need_mem=True) -> None:
+        self.need_int = need_int
+        self.need_ptr = need_ptr
+        self.need_mem = need_mem
+        self.alive_sites = []
+        self.int_values = {}
+        self.int_values_repeat = []
+        self.ptr_values = {}
+        self.ptr_values_repeat = []
+        self.mem_range_global = {}
+        self.mem_range_local = []
+        self.mem_values = {}
+        self.mem_values_repeat = [] # record all mem_values indexs that have more than 1 access with different values
+        self.local_regions = LocalRegions()
+        self.mem_accesses = [] # (id, access_mem, access_end, (head, size) of the enclosing local or None, changed)
+
+    def add_event(self, kind, id, a, b):
+        flags = kind
+        kind &= TRACE_KIND_MASK
+        if kind == TRACE_INST:
+            self.alive_sites.append(f'ID{id}')
+        elif kind == TRACE_INT:
+            if not self.need_int:
+                return
+            lhs = a if flags & TRACE_LHS_UNSIGNED else to_signed64(a)
+            rhs = b if flags & TRACE_RHS_UNSIGNED else to_signed64(b)
+            site = f'ID{id}'
+            if site in self.int_values:
+                if (lhs, rhs) != self.int_values[site]:
+                    self.int_values_repeat.append(site)
+            self.int_values[site] = (lhs, rhs)
+        elif kind == TRACE_PTR:
+            if not self.need_ptr or a == 0: # NULL was printed as (nil), which the text format never matched
+                return
+            site = f'ID{id}'
+            if site in self.ptr_values:
+                self.ptr_values_repeat.append(site)
+            self.ptr_values[site] = hex(a)
+        elif not self.need_mem:
+            return
+        elif kind == TRACE_GLOBAL:
+            self.mem_range_global[a] = b
+        elif kind == TRACE_LOCAL:
+            self.mem_range_local.append([a, b])
+            self.local_regions.add(a, b)
+        elif kind == TRACE_MEM:
+            # globals are resolved in finish(), all of them are known by then
+            self.mem_accesses.append((id, a, b, self.local_regions.find(a, b - a), False))
+
+    def keep_kinds(self):
+        keep = [TRACE_INST, TRACE_INST_HIT]
+        if self.need_int:
+            keep.append(TRACE_INT)
+        if self.need_ptr:
+            keep.append(TRACE_PTR)
+        if self.need_mem:
+            keep += [TRACE_MEM, TRACE_GLOBAL, TRACE_LOCAL, TRACE_MEM_LOCAL]
+        return keep
+
+    def add_records(self, records):
+        """
+        Add an array of TRACE_RECORD, e.g., from load_binary_trace().
+        """
+        keep = self.keep_kinds()
+        for start in range(0, len(records), CHUNK_RECORDS):
+            chunk = records[start:start+CHUNK_RECORDS]
+            chunk = chunk[np.isin(chunk['kind'] & TRACE_KIND_MASK, keep)]
+            for kind, id, a, b in zip(chunk['kind'].tolist(), chunk['id'].tolist(), chunk['a'].tolist(), chunk['b'].tolist()):
+                self.add_event(kind, id, a, b)
+
+    def add_summary_records(self, records):
+        """
+        Add the per-site records a program instrumented with the summary
+        format writes at exit.
+        """
+        kinds = records['kind'] & TRACE_KIND_MASK
+        hits = records[kinds == TRACE_INST_HIT]
+        order = np.argsort(hits['a'], kind='stable')
+        self.alive_sites += [f'ID{x}' for x in hits['id'][order].tolist()]
+        records = records[np.isin(kinds, self.keep_kinds()) & (kinds != TRACE_INST_HIT)]
+        for kind, id, a, b in zip(records['kind'].tolist(), records['id'].tolist(), records['a'].tolist(), records['b'].tolist()):
+            changed = bool(kind & TRACE_CHANGED)
+            if kind & TRACE_KIND_MASK == TRACE_INT:
+                lhs = a if kind & TRACE_LHS_UNSIGNED else to_signed64(a)
+                rhs = b if kind & TRACE_RHS_UNSIGNED else to_signed64(b)
+                self.int_values[f'ID{id}'] = (lhs, rhs)
+                if changed:
+                    self.int_values_repeat.append(f'ID{id}')
+            elif kind & TRACE_KIND_MASK == TRACE_MEM:
+                self.mem_accesses.append((id, a, b, None, changed))
+            elif kind & TRACE_KIND_MASK == TRACE_MEM_LOCAL:
+                access = self.mem_accesses[-1]
+                self.mem_accesses[-1] = access[:3] + ((a, b),) + access[4:]
+            else:
+                self.add_event(kind, id, a, b)
+
+    def add_text(self, out):
+        """
+        Add the events printed by a program instrumented with the text format.
+        """
+        for event in TEXT_EVENT.finditer(out):
+            record = text_event_to_record(*event.groups())
+            if record is not None:
+                self.add_event(*record)
+
+    def finish(self):
+        global_regions = GlobalRegions(self.mem_range_global)
+        for id, access_mem, access_end, local, changed in self.mem_accesses:
+            access_size = access_end - access_mem
+            tgt_mem_head, tgt_mem_size = access_mem, access_size
+            is_global = False
+            region = global_regions.find(access_mem, access_size)
+            if region is not None:
+                tgt_mem_head, tgt_mem_size = region
+                is_global = True
+            is_local = False
+            # a local from a summary trace must hold the whole access, as in LocalRegions.find
+            if not is_global and local is not None and local[0] <= access_mem and access_end <= local[0] + local[1]:
+                tgt_mem_head, tgt_mem_size = local
+                is_local = True
+            site = f'ID{id}'
+            if changed or (site in self.mem_values and access_mem != self.mem_values[site][0]): # record all mem_values that have more than 1 unique access address
+                self.mem_values_repeat.append(site)
+            self.mem_values[site] = [access_mem, access_size, tgt_mem_head, tgt_mem_size, is_global, is_local]
+        self.mem_accesses = []
+
+
+def run_instrumented(cmd, tables, text=True, time_out=10, max_bytes=None, env=None):
+    """
+    Run an instrumented program and, with the text format, add its trace to
+    `tables` while it runs instead of buffering the whole output.
+    The program is killed once it printed more than max_bytes or ran for
+    time_out seconds. Returns (ret, reason) with a nonzero ret on failure.
+    """
+    if type(cmd) is not list:
+        cmd = cmd.split(' ')
+    try:
+        process = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.DEVNULL, env=env)
+    except OSError as e:
+        return 1, str(e)
+    timed_out = threading.Event()
+    def kill():
+        timed_out.set()
+        process.kill()
+    timer = threading.Timer(time_out, kill)
+    timer.start()
+    read, pending, reason = 0, b'', ''
+    try:
+        while True:
+            chunk = process.stdout.readline(1 << 16)
+            if not chunk:
+                break
+            read += len(chunk)
+            if max_bytes is not None and read > max_bytes:
+                process.kill()
+                reason = f'trace exceeded {max_bytes} bytes'
+                break
+            if not text:
+                continue
+            pending += chunk
+            if pending.endswith(b'\n'): # a line longer than a chunk is parsed once complete
+                tables.add_text(pending.decode('utf-8', errors='replace'))
+                pending = b''
+        if pending and not reason:
+            tables.add_text(pending.decode('utf-8', errors='replace'))
+    finally:
+        process.stdout.close()
+        ret = process.wait()
+        timer.cancel()
+    if timed_out.is_set():
+        return ret or 1, f'timed out after {time_out} seconds'
+    if reason:
+        return ret or 1, reason
+    return ret, '' if ret == 0 else f'exit status {ret}'
@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import os, re, sys
+sys.path.append(os.path.dirname(__file__))
+from config import *
+
+# textual upper bounds of what the clang tools match, e.g., `int32_t *l_5` counts as
+# a dereference; a seed with none of what a UB needs has no site for it
+SEED_CONSTRUCTS = {
+    'function': re.compile(r'^[A-Za-z_][^;{}()#]*?\b(?!main\b)\w+\s*\([^;{}]*\)\s*\{', re.M), # definitions other than main
+    'array': re.compile(r'\b[lgp]_\d+\s*\['), # ArrayIndexAdd
+    'pointer': re.compile(r'\*\s*\(*[lgp]_\d+'), # ArrayIndexAdd, AnalyzerInstrumenter
+    'local': re.compile(r'\bl_\d+\s*[=;\[]'), # VARREF_INIT
+    'local_array': re.compile(r'\bl_\d+\s*\['), # StackToHeap only moves local arrays to the heap
+    'intop': re.compile(r'[\w)\]]\s*(?:<<|>>|[-+*/%])\s*[\w(]'), # IntegerAdd
+    'divop': re.compile(r'[\w)\]]\s*[/%]\s*[\w(]'),
+}
+
+UB_CONSTRUCTS = { # by TargetUB name, TargetUB is not hashable
+    'BufferOverflow':  ['array', 'pointer'],
+    'OutBound':        ['array'],
+    'NullPtrDeref':    ['pointer'],
+    'UseAfterScope':   ['pointer', 'local'],
+    'UseAfterFree':    ['pointer', 'local_array'],
+    'DoubleFree':      ['local_array'],
+    'MemoryLeak':      ['local_array'],
+    'IntegerOverflow': ['intop'],
+    'DivideZero':      ['divop'],
+    'UseUninit':       ['local'],
+}
+
+CSMITH_REMOVES = { # Csmith options that leave a seed without a construct
+    '--no-arrays':   ['array', 'local_array'],
+    '--no-pointers': ['pointer'],
+}
+
+def count_constructs(src, names=None) -> dict:
+    """
+    Matches of SEED_CONSTRUCTS (or the given names of them) in a seed's source.
+    """
+    names = SEED_CONSTRUCTS if names is None else names
+    return {name: len(SEED_CONSTRUCTS[name].findall(src)) for name in names}
+
+def prefilter_seed(src, target_ub=None):
+    """
+    The reason to reject a seed's source before the sanitizer check, or None:
+    'size', 'function' or the first construct target_ub needs that is missing.
+    """
+    if len(src) < MIN_PROGRAM_SIZE:
+        return 'size'
+    names = ['function'] + (UB_CONSTRUCTS.get(target_ub.name, []) if target_ub is not None else [])
+    for name, count in count_constructs(src, names).items():
+        if count < MIN_SEED_CONSTRUCTS:
+            return name
+    return None
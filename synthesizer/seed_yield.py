@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import os, sys, json, random, threading
+sys.path.append(os.path.dirname(__file__))
+from config import *
+
+MIN_PROFILE_SEEDS = 3 # seeds every profile gets before the yields are compared
+EXPLORE_PROB = 0.1 # chance to try another profile than the best one
+
+def csmith_profiles(target_ub) -> list:
+    """
+    The Csmith option profiles for target_ub, or [''] if there are none.
+    """
+    return CSMITH_UB_PROFILES.get(target_ub.name, ['']) if target_ub is not None else ['']
+
+class YieldTracker:
+    """
+    Seeds, mutants, empty seeds and wall-clock seconds per Csmith option profile,
+    and the choice of the profile of the next seed: each profile gets
+    MIN_PROFILE_SEEDS seeds, then the one with the most mutants per
+    second is preferred, trying another one with EXPLORE_PROB.
+    With a path, the counts are loaded from and saved to that JSON file under
+    `name`, e.g., the target UB, so that later runs start from what earlier
+    ones learned.
+    """
+    def __init__(self, profiles, path=None, name='', explore=EXPLORE_PROB, rng=None) -> None:
+        self.profiles = list(profiles)
+        self.path = path
+        self.name = name
+        self.explore = explore
+        self.rng = rng if rng is not None else random.Random()
+        self.lock = threading.Lock() # choose() is called by the SeedQueue producers
+        self.stats = {profile: {'seeds': 0, 'mutants': 0, 'empty': 0, 'seconds': 0.0} for profile in self.profiles}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f).get(name, {})
+            for profile in self.profiles:
+                self.stats[profile].update(saved.get(profile, {}))
+
+    def mutants_per_hour(self, profile) -> float:
+        stats = self.stats[profile]
+        return stats['mutants'] / stats['seconds'] * 3600 if stats['seconds'] > 0 else 0.0
+
+    def choose(self) -> str:
+        with self.lock:
+            untried = [p for p in self.profiles if self.stats[p]['seeds'] < MIN_PROFILE_SEEDS]
+            if untried:
+                return min(untried, key=lambda p: self.stats[p]['seeds'])
+            if self.rng.random() < self.explore:
+                return self.rng.choice(self.profiles)
+            return max(self.profiles, key=self.mutants_per_hour)
+
+    def record(self, profile, mutants, seconds):
+        with self.lock:
+            stats = self.stats.setdefault(profile, {'seeds': 0, 'mutants': 0, 'empty': 0, 'seconds': 0.0})
+            stats['seeds'] += 1
+            stats['mutants'] += mutants
+            stats['empty'] += mutants == 0
+            stats['seconds'] += seconds
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            saved = {}
+            if os.path.exists(self.path): # keep the other names, e.g., UBs
+                with open(self.path) as f:
+                    saved = json.load(f)
+            saved[self.name] = self.stats
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(saved, f, indent=1)
+            os.replace(tmp_path, self.path)
+
+    def summary(self) -> str:
+        lines = []
+        for profile in self.profiles:
+            stats = self.stats[profile]
+            if stats['seeds'] == 0:
+                continue
+            lines.append(f"  `{profile or '(default)'}`: {stats['seeds']} seeds, {stats['empty']} empty, "
+                         f"{stats['mutants']} mutants, {self.mutants_per_hour(profile):.1f} mutants per hour")
+        return '\n'.join(lines)
@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import re, hashlib
+from bisect import bisect_right
+
+# the markers Synthesizer.insert edits, found in one pass over the instrumented source
+SOURCE_MARKER = re.compile(
+    r'/\*I:ID(?P<site>\d+):INSERTIONSITE:\*/'        # AnalyzerInstrumenter
+    r'|/\*I:ID(?P<free>\d+):VARREF_FREE:'            # StackToHeap
+    r'|/\*I:ID(?P<init>\d+):VARREF_INIT:'            # AnalyzerInstrumenter
+    r'|#define (?P<define>_MUT\w*?\d+|_INTOP[LR]\d+) ' # ArrayIndexAdd, IntegerAdd
+    r'|(?P<use>_MUT\w*?\d+|_INTOP[LR]\d+)\)'
+)
+
+class MarkerIndex:
+    """
+    Offsets of every marker in an instrumented source.
+    Built once per seed, so that a mutant is a few edits (start, end, text)
+    against the source instead of a substitution over the whole file.
+    """
+    def __init__(self, src) -> None:
+        self.sites = {} # int ID -> spans of `/*I:ID:INSERTIONSITE:*/`
+        self.frees = {} # int ID -> start of the first `/*I:ID:VARREF_FREE:`
+        self.inits = {} # int ID -> start of the first `/*I:ID:VARREF_INIT:`
+        self.defines = {} # placeholder -> spans of `#define placeholder `
+        self.uses = {} # placeholder -> spans of `placeholder)`
+        for m in SOURCE_MARKER.finditer(src):
+            kind = m.lastgroup
+            key = m.group(kind)
+            if kind in ('site', 'free', 'init'):
+                key = int(key)
+            if kind == 'free':
+                self.frees.setdefault(key, m.start())
+            elif kind == 'init':
+                self.inits.setdefault(key, m.start())
+            elif kind == 'site':
+                self.sites.setdefault(key, []).append(m.span())
+            elif kind == 'define':
+                self.defines.setdefault(key, []).append(m.span())
+            else: # use: the placeholder only, `)` stays
+                self.uses.setdefault(key, []).append(m.span(kind))
+
+def splice(src, edits) -> str:
+    """
+    Apply non-overlapping edits (start, end, text), given as offsets into src.
+    """
+    pieces = []
+    last = 0
+    for start, end, text in sorted(edits, key=lambda e: (e[0], e[1])):
+        if start < last:
+            raise ValueError(f'overlapping edit at {start}')
+        pieces.append(src[last:start])
+        pieces.append(text)
+        last = end
+    pieces.append(src[last:])
+    return ''.join(pieces)
+
+def diff_edit(base, text):
+    """
+    One edit (start, end, replacement) with splice(base, [edit]) == text,
+    from the common prefix and suffix of base and text.
+    """
+    # binary searches over slice comparisons, which run at memcmp speed
+    lo, hi = 0, min(len(base), len(text))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if base[:mid] == text[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    prefix = lo
+    lo, hi = 0, min(len(base), len(text)) - prefix
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if base[len(base)-mid:] == text[len(text)-mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    suffix = lo
+    return prefix, len(base) - suffix, text[prefix:len(text)-suffix]
+
+# what Synthesizer.clean_instrument removes; none of them crosses a line
+CLEAN_PATTERNS = [
+    re.compile(r'\/\*I:.*'), # all instrumented comments
+    re.compile(r'int MUT_ARR_\d+ = 0;'), # all MUT_ARR_id
+    re.compile(r'MUT_ARR_\d+\+'),
+    re.compile(r'int MUT_PTR_\d+ = 0;'), # all MUT_PTR_id
+    re.compile(r'\+MUT_PTR_\d+'),
+]
+
+def clean_source(src) -> str:
+    for pattern in CLEAN_PATTERNS:
+        src = pattern.sub('', src)
+    return src
+
+DIGEST_SIZE = 16
+
+def mutant_digest(src) -> bytes:
+    """
+    Content key of a mutant, str, bytes or Mutant.
+    """
+    if isinstance(src, Mutant):
+        return src.digest
+    return hashlib.blake2b(src.encode('utf-8') if isinstance(src, str) else src, digest_size=DIGEST_SIZE).digest()
+
+def line_starts(src) -> list:
+    return [0] + [m.end() for m in re.finditer('\n', src)]
+
+class CleanBase:
+    """
+    The cleaned form of an instrumented source, computed once per seed.
+    Cleaning is line by line, so a mutant is the clean base with only the
+    lines its edits touch re-cleaned, the same as cleaning the whole mutant.
+    """
+    def __init__(self, src) -> None:
+        self.src = src
+        self.clean = clean_source(src)
+        self.src_lines = line_starts(src)
+        self.clean_lines = line_starts(self.clean)
+        assert len(self.src_lines) == len(self.clean_lines)
+        # char offsets are byte offsets, so digest() can hash slices of it
+        self.clean_bytes = self.clean.encode('utf-8') if self.clean.isascii() else None
+
+    def patch(self, edits) -> str:
+        """
+        clean_source(splice(self.src, edits)) without cleaning the whole file.
+        """
+        return splice(self.clean, self.clean_edits(edits))
+
+    def clean_edits(self, edits) -> list:
+        """
+        The edits mapped into the clean base as (start, end, text) over whole lines.
+        Lines that cleaning restores are dropped, e.g., edits inside `/*I:` comments,
+        so equal lists mean equal mutants.
+        """
+        # group the edits by the lines they touch
+        blocks = []
+        for start, end, text in sorted(edits, key=lambda e: (e[0], e[1])):
+            first = bisect_right(self.src_lines, start) - 1
+            last = bisect_right(self.src_lines, end) - 1
+            if blocks and first <= blocks[-1][1]:
+                blocks[-1][1] = max(blocks[-1][1], last)
+                blocks[-1][2].append((start, end, text))
+            else:
+                blocks.append([first, last, [(start, end, text)]])
+        clean_edits = []
+        for first, last, block_edits in blocks:
+            block_start = self.src_lines[first]
+            block_end = self.src_lines[last+1] if last+1 < len(self.src_lines) else len(self.src)
+            block = splice(self.src[block_start:block_end], [(s-block_start, e-block_start, t) for s, e, t in block_edits])
+            clean_start = self.clean_lines[first]
+            clean_end = self.clean_lines[last+1] if last+1 < len(self.clean_lines) else len(self.clean)
+            block = clean_source(block)
+            if block != self.clean[clean_start:clean_end]:
+                clean_edits.append((clean_start, clean_end, block))
+        return clean_edits
+
+    def digest(self, clean_edits) -> bytes:
+        """
+        mutant_digest(splice(self.clean, clean_edits)), hashing the pieces
+        instead of building the mutant.
+        """
+        if self.clean_bytes is None:
+            return mutant_digest(splice(self.clean, clean_edits))
+        h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        view = memoryview(self.clean_bytes)
+        last = 0
+        for start, end, text in clean_edits: # sorted and disjoint
+            h.update(view[last:start])
+            h.update(text.encode('utf-8'))
+            last = end
+        h.update(view[last:])
+        return h.digest()
+
+
+class Mutant:
+    """
+    A mutant as the clean base of its seed and edits (start, end, text) of it,
+    e.g., CleanBase.clean_edits(); the source is only built by materialize().
+    Mutants of one seed share the base string, in memory and when pickled together.
+    """
+    __slots__ = ('base', 'edits', 'digest')
+
+    def __init__(self, base, edits, digest=None) -> None:
+        self.base = base
+        self.edits = tuple(sorted(edits, key=lambda e: (e[0], e[1])))
+        self.digest = digest if digest is not None else mutant_digest(self.materialize())
+
+    def __eq__(self, other):
+        return isinstance(other, Mutant) and self.digest == other.digest
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def materialize(self) -> str:
+        return splice(self.base, self.edits)
+
+    __str__ = materialize
+
+    def span_edit(self):
+        """
+        The edits as one edit (start, end, text) of the base.
+        """
+        if not self.edits:
+            return 0, 0, ''
+        start, end = self.edits[0][0], self.edits[-1][1]
+        return start, end, splice(self.base[start:end], [(s-start, e-start, t) for s, e, t in self.edits])
+
+    def count(self, sub) -> int:
+        """
+        self.materialize().count(sub) for a sub without newlines,
+        given edits over whole lines as CleanBase.clean_edits() makes.
+        """
+        n = self.base.count(sub)
+        for start, end, text in self.edits:
+            n += text.count(sub) - self.base.count(sub, start, end)
+        return n
+
+def materialize(mutant):
+    """
+    The source of a mutant given as str, bytes or Mutant.
+    """
+    return mutant.materialize() if isinstance(mutant, Mutant) else mutant
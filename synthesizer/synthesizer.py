@@ -4,13 +4,18 @@ import os, re, string, hashlib, sys
 sys.path.append(os.path.dirname(__file__))
 import json
 import shutil
+import tempfile
 import random
 from numpy.random import permutation
 import subprocess as sp
-from copy import deepcopy
-from enum import Enum, auto
+from enum import IntEnum, auto
+from array import array
 from math import ceil, floor
+from bisect import bisect_left, bisect_right
 from config import *
+from instrument_server import get_instrument_server
+from runtime_trace import TraceTables, TRACE_RECORD, load_binary_trace, run_instrumented
+from source_patch import MarkerIndex, CleanBase, Mutant, clean_source, splice
 
 valid_types = [
     'char', 'float', 'double', 'int', 'long',
@@ -50,12 +55,12 @@ def retrieve_vars(expr):
     """
     return re.findall(r'[\w|_]+', expr)
 
-def run_cmd(cmd, time_out=10):
+def run_cmd(cmd, time_out=10, env=None):
     if type(cmd) is not list:
         cmd = cmd.split(' ')
     ret, out = 0, ''
     try:
-        process = sp.run(cmd, timeout=time_out, capture_output=True)
+        process = sp.run(cmd, timeout=time_out, capture_output=True, env=env)
         ret = process.returncode
         out = process.stdout.decode('utf-8')
     except Exception as e:
@@ -132,7 +137,7 @@ def get_primitive_type(int_type:str) -> str:
             return 'uint64_t'
 
 
-class InstrumentType(Enum):
+class InstrumentType(IntEnum):
     FUNCTIONENTER   = auto()
     BRACESTART      = auto()
     BRACEEND        = auto()
@@ -148,17 +153,165 @@ class InstrumentType(Enum):
     VARREF_FREE     = auto()
     VARREF_INIT     = auto()
 
+class InstrumentInfo:
+    """
+    Instrumentation records of a seed in source order, one column per field.
+    IDs are the integers of `/*I:ID<n>:...*/` and strings are interned, so
+    the backward scans of insert compare small ints and shared strings.
+    Unused fields are None, e.g., everything but the kind of a FUNCTIONENTER.
+    """
+    __slots__ = ('kinds', 'ids', 'types', 'exprs', 'rhs_types', 'rhs_exprs', 'ops')
+
+    def __init__(self) -> None:
+        self.kinds = array('B') # InstrumentType
+        self.ids = array('q') # -1 if the record has none
+        self.types = [] # type of the var, or of the lhs of VARREF_INTEGER
+        self.exprs = [] # var expr, or the lhs of VARREF_INTEGER
+        self.rhs_types = [] # VARREF_INTEGER only
+        self.rhs_exprs = [] # rhs of VARREF_INTEGER, or the index var of VARREF_ARRAY
+        self.ops = [] # VARREF_INTEGER only
+
+    def append(self, kind, id=-1, type=None, expr=None, rhs_type=None, rhs_expr=None, op=None):
+        intern = lambda x: None if x is None else sys.intern(x)
+        self.kinds.append(kind)
+        self.ids.append(id)
+        self.types.append(intern(type))
+        self.exprs.append(intern(expr))
+        self.rhs_types.append(intern(rhs_type))
+        self.rhs_exprs.append(intern(rhs_expr))
+        self.ops.append(intern(op))
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def site(self, idx) -> str:
+        # the key of the record in the runtime trace tables, e.g., mem_values
+        return f'ID{self.ids[idx]}'
+
+# the records insert can mutate
+VARREF_TYPES = (
+    InstrumentType.VARREF_POINTER, InstrumentType.VARREF_POINTERINDEX, InstrumentType.VARREF_ARRAY, InstrumentType.VARREF_MEMORY,
+    InstrumentType.VARREF_INTEGER, InstrumentType.VARREF_FREE, InstrumentType.VARREF_INIT,
+)
+
+# UBs that one instrumentation serves, by the --mode of AnalyzerInstrumenter;
+# int and zero log disjoint operators, so they are instrumented apart
+UB_MODE_GROUPS = [
+    ('mem', [TargetUB.BufferOverflow, TargetUB.OutBound]),
+    ('ptr', [TargetUB.NullPtrDeref, TargetUB.UseAfterFree, TargetUB.UseAfterScope, TargetUB.DoubleFree, TargetUB.MemoryLeak]),
+    ('int', [TargetUB.IntegerOverflow]),
+    ('zero', [TargetUB.DivideZero]),
+    ('init', [TargetUB.UseUninit]),
+]
+
+class FunctionIndex:
+    """
+    Sorted positions of the instrument_info records that end or feed the
+    backward scans of insert, so a scan jumps to where it would stop instead
+    of walking every record back to FUNCTIONENTER.
+    """
+    def __init__(self, instrument_info) -> None:
+        self.starts = [] # FUNCTIONENTER
+        self.sites = [] # INSTRUMENTSITE
+        self.values = [] # VARREF_POINTER, VARREF_ARRAY, VARREF_INTEGER and VARDECL
+        self.decl_names = {} # var name -> VARDECL
+        self.decl_exprs = {} # var expr -> VARDECL
+        self.refs = {} # var name -> VARREF_POINTER, VARREF_ARRAY and VARREF_INTEGER
+        self.assigns = {} # var expr -> VARREF_ASSIGN
+        for idx in range(len(instrument_info)):
+            kind = instrument_info.kinds[idx]
+            expr = instrument_info.exprs[idx]
+            if kind == InstrumentType.FUNCTIONENTER:
+                self.starts.append(idx)
+            elif kind == InstrumentType.INSTRUMENTSITE:
+                self.sites.append(idx)
+            elif kind == InstrumentType.VARREF_ASSIGN:
+                self.assigns.setdefault(expr, []).append(idx)
+            elif kind in (InstrumentType.VARREF_POINTER, InstrumentType.VARREF_ARRAY, InstrumentType.VARREF_INTEGER, InstrumentType.VARDECL):
+                self.values.append(idx)
+                names = retrieve_vars(expr)
+                if not names:
+                    continue
+                if kind == InstrumentType.VARDECL:
+                    self.decl_names.setdefault(names[0], []).append(idx)
+                    self.decl_exprs.setdefault(expr, []).append(idx)
+                else:
+                    self.refs.setdefault(names[0], []).append(idx)
+
+    @staticmethod
+    def last_before(positions, idx) -> int:
+        # the last position < idx, or -1
+        if not positions:
+            return -1
+        i = bisect_left(positions, idx)
+        return positions[i-1] if i > 0 else -1
+
+    @staticmethod
+    def between(positions, lo, hi) -> list:
+        # positions in (lo, hi), last first
+        return positions[bisect_right(positions, lo):bisect_left(positions, hi)][::-1]
+
+    def function_values(self, idx) -> list:
+        # the var records from idx back to the entry of its function, last first
+        return self.between(self.values, max(0, self.last_before(self.starts, idx)), idx+1)
+
+    def site_stop(self, idx, var_name, assign_expr=None, decl_expr=None) -> int:
+        # where insert's backward search for instrumentation sites before idx stops, or 0:
+        # at the function entry, at a declaration of var_name and, once an instrumentation
+        # site has been passed, at another reference to var_name; also at an assignment
+        # to assign_expr and at the declaration of decl_expr, if given
+        stop = max(0,
+            self.last_before(self.starts, idx),
+            self.last_before(self.decl_names.get(var_name), idx),
+            self.last_before(self.refs.get(var_name), self.last_before(self.sites, idx)))
+        if assign_expr is not None:
+            stop = max(stop, self.last_before(self.assigns.get(assign_expr), idx))
+        if decl_expr is not None:
+            stop = max(stop, self.last_before(self.decl_exprs.get(decl_expr), idx))
+        return stop
+
+def parse_id(info_id) -> int:
+    # 'ID12' -> 12
+    return int(info_id[2:]) if info_id[2:].isdigit() else -1
+
+
 class ScopeTree:
     def __init__(self, id) -> None:
         self.parent = None
         self.children = []
         self.id = id
+        # preorder number of this scope and the largest one in its subtree, see number()
+        self.enter = 0
+        self.exit = 0
+
+    def number(self):
+        """
+        Number the tree in preorder, so that a scope is a (grand)child of
+        another one iff its number lies in the other's (enter, exit].
+        """
+        count = 0
+        stack = [(self, False)]
+        while stack:
+            node, done = stack.pop()
+            if done:
+                node.exit = count - 1
+                continue
+            node.enter = count
+            count += 1
+            stack.append((node, True))
+            for child in reversed(node.children):
+                stack.append((child, False))
 
 
 class Synthesizer:
-    def __init__(self, prob, tmp_dir=None, given_TOOL_STACKTOHEAP=None, given_ALL_TARGET_UB=None, given_CONFIG_IntegerOverflow=None) -> None:
+    def __init__(self, prob, tmp_dir=None, given_TOOL_STACKTOHEAP=None, given_ALL_TARGET_UB=None, given_CONFIG_IntegerOverflow=None,
+                 config: SynthesizerConfig=None) -> None:
+        """
+        The targets come from `config`, or else from the given_* overrides of
+        the defaults of SynthesizerConfig; no module global is changed, so
+        synthesizers of different targets can run in one process.
+        """
         assert 0 < prob <= 100
-        global TOOL_STACKTOHEAP, ALL_TARGET_UB, CONFIG_IntegerOverflow
         self.prob = prob
         self.tmp_dir = tmp_dir
         if self.tmp_dir is not None:
@@ -166,142 +319,102 @@ class Synthesizer:
                 os.makedirs(self.tmp_dir)
         self.instrument_info = []
         self.mutants = []
-        if given_TOOL_STACKTOHEAP: # for tests only
-            TOOL_STACKTOHEAP = given_TOOL_STACKTOHEAP
-        if given_ALL_TARGET_UB: # for tests only
-            ALL_TARGET_UB = given_ALL_TARGET_UB
-        if given_CONFIG_IntegerOverflow:
-            CONFIG_IntegerOverflow = given_CONFIG_IntegerOverflow
-
-        if len(ALL_TARGET_UB) != 1:
-            print("We only support one target_ub in ALL_TARGET_UB now.")
-            exit(1)
+        if config is None:
+            overrides = {}
+            if given_TOOL_STACKTOHEAP: # for tests only
+                overrides['tool_stacktoheap'] = given_TOOL_STACKTOHEAP
+            if given_ALL_TARGET_UB: # for tests only
+                overrides['target_ubs'] = given_ALL_TARGET_UB
+            if given_CONFIG_IntegerOverflow:
+                overrides['integer_overflow'] = given_CONFIG_IntegerOverflow
+            config = SynthesizerConfig(**overrides)
+        self.config = config
+        self.target_ubs = list(config.target_ubs) # what instrument() and insert() target; synthesize_session() changes it
 
     def instrument(self, filename):
         """
         Instrument file
         """
-        # 1. add braces
-        cmd = f'{TOOL_ADDBRACES} {filename} -- -w {COMPILE_ARGS}'
-        ret, out = run_cmd(cmd)
-        if ret != 0:
-            raise InstrumentError(f"TOOL_ADDBRACES failed : {out}.")
-
-        # 2. add necessary extra information
-        if has_overlap([TargetUB.IntegerOverflow, TargetUB.DivideZero], ALL_TARGET_UB):
-            cmd = f'{TOOL_ADDINTEGER} {filename} -- -w {COMPILE_ARGS}'
-            ret, out = run_cmd(cmd)
-            if ret != 0:
-                raise InstrumentError(f"TOOL_ADDINTEGER failed : {out}.")
-        if has_overlap([TargetUB.BufferOverflow, TargetUB.OutBound], ALL_TARGET_UB) > 0:
-            cmd = f'{TOOL_ADDARRAYINDEX} {filename} -- -w {COMPILE_ARGS}'
-            ret, out = run_cmd(cmd)
-            if ret != 0:
-                raise InstrumentError(f"TOOL_ADDARRAYINDEX failed : {out}.")
-
-        # 3. instrument
-        if has_overlap([TargetUB.IntegerOverflow], ALL_TARGET_UB):
-            cmd = f'{TOOL_INSTRUMENTER} {filename} --mode=int -- -w {COMPILE_ARGS}'
-        elif has_overlap([TargetUB.DivideZero], ALL_TARGET_UB):
-            cmd = f'{TOOL_INSTRUMENTER} {filename} --mode=zero -- -w {COMPILE_ARGS}'
-        elif has_overlap([TargetUB.BufferOverflow, TargetUB.OutBound], ALL_TARGET_UB) > 0:
-            cmd = f'{TOOL_INSTRUMENTER} {filename} --mode=mem -- -w {COMPILE_ARGS}'
-        elif has_overlap([TargetUB.NullPtrDeref, TargetUB.UseAfterFree, TargetUB.UseAfterScope, TargetUB.DoubleFree, TargetUB.MemoryLeak], ALL_TARGET_UB) > 0:
-            cmd = f'{TOOL_INSTRUMENTER} {filename} --mode=ptr -- -w {COMPILE_ARGS}'
-        elif has_overlap([TargetUB.UseUninit], ALL_TARGET_UB):
-            cmd = f'{TOOL_INSTRUMENTER} {filename} --mode=init -- -w {COMPILE_ARGS}'
-
-        ret, out = run_cmd(cmd)
-        if ret != 0:
-            raise InstrumentError(f"TOOL_INSTRUMENTER failed : {out}.")
+        add_integer = has_overlap([TargetUB.IntegerOverflow, TargetUB.DivideZero], self.target_ubs)
+        add_arrayindex = has_overlap([TargetUB.BufferOverflow, TargetUB.OutBound], self.target_ubs)
+        stack_to_heap = has_overlap([TargetUB.BufferOverflow, TargetUB.UseAfterFree, TargetUB.UseAfterScope, TargetUB.DoubleFree, TargetUB.MemoryLeak], self.target_ubs)
+        if has_overlap([TargetUB.IntegerOverflow], self.target_ubs):
+            mode = 'int'
+        elif has_overlap([TargetUB.DivideZero], self.target_ubs):
+            mode = 'zero'
+        elif has_overlap([TargetUB.BufferOverflow, TargetUB.OutBound], self.target_ubs):
+            mode = 'mem'
+        elif has_overlap([TargetUB.NullPtrDeref, TargetUB.UseAfterFree, TargetUB.UseAfterScope, TargetUB.DoubleFree, TargetUB.MemoryLeak], self.target_ubs):
+            mode = 'ptr'
+        elif has_overlap([TargetUB.UseUninit], self.target_ubs):
+            mode = 'init'
 
-        # stack to heap
-        if has_overlap([TargetUB.BufferOverflow, TargetUB.UseAfterFree, TargetUB.UseAfterScope, TargetUB.DoubleFree, TargetUB.MemoryLeak], ALL_TARGET_UB) > 0:
-            cmd = f'{TOOL_STACKTOHEAP} {filename} -- -w {COMPILE_ARGS}'
-            ret, out = run_cmd(cmd)
+        if os.path.exists(TOOL_PIPELINE):
+            # 1-3. all passes in one clang-tool process; the file is only written once
+            ret, out = self.run_pipeline(filename, mode, add_integer, add_arrayindex, stack_to_heap)
             if ret != 0:
-                raise InstrumentError(f"TOOL_STACKTOHEAP failed : {out}.")
+                raise InstrumentError(f"TOOL_PIPELINE failed : {out}.")
+        else:
+            self.instrument_tools(filename, mode, add_integer, add_arrayindex, stack_to_heap)
 
         # 4. compile and run to get alive regions
         tmp_out = get_random_string(5) + '.out'
+        if self.tmp_dir is not None: # keep concurrent synthesizers from sharing the cwd
+            tmp_out = os.path.join(self.tmp_dir, tmp_out)
         cmd = f'{CC} -w {COMPILE_ARGS} {filename} -o {tmp_out}'
         ret, out = run_cmd(cmd)
         if ret != 0:
             if os.path.exists(tmp_out):
                 os.remove(tmp_out)
             raise InstrumentError(f"Compile instrumented file failed : {out}.")
-        cmd = f'./{tmp_out}'
-        ret, out = run_cmd(cmd)
+        cmd = os.path.abspath(tmp_out)
+        trace_file = cmd + '.trace'
+        env = dict(os.environ, UBGEN_TRACE=trace_file, UBGEN_TRACE_LIMIT=str(TRACE_MAX_BYTES // TRACE_RECORD.itemsize))
+        tables = TraceTables(
+            need_int=has_overlap([TargetUB.IntegerOverflow, TargetUB.DivideZero], self.target_ubs),
+            need_ptr=has_overlap([TargetUB.NullPtrDeref], self.target_ubs),
+            need_mem=has_overlap([TargetUB.BufferOverflow, TargetUB.OutBound], self.target_ubs),
+        )
+        # the text trace is parsed while the program runs, records are read afterwards
+        ret, out = run_instrumented(cmd, tables, text=TRACE_FORMAT == 'text', max_bytes=TRACE_MAX_BYTES, env=env)
         if os.path.exists(tmp_out):
             os.remove(tmp_out)
         if ret != 0:
+            if os.path.exists(trace_file):
+                if os.path.getsize(trace_file) >= TRACE_MAX_BYTES - TRACE_RECORD.itemsize:
+                    out = f'trace exceeded {TRACE_MAX_BYTES} bytes'
+                os.remove(trace_file)
             raise InstrumentError(f"Run instrumented file failed : {out}.")
-        self.alive_sites = [ f'ID{x}' for x in re.findall(r'INST:(\d+)', out)]
-        if has_overlap([TargetUB.IntegerOverflow, TargetUB.DivideZero], ALL_TARGET_UB):
-            int_values_ori = re.findall(r'INT:([\-|\d]+):([\-|\d]+):([\-|\d]+)', out)
-            self.int_values = {}
-            self.int_values_repeat = []
-            for int_v in int_values_ori:
-                if f'ID{int_v[0]}' in self.int_values:
-                    if int_v[1:] != self.int_values[f'ID{int_v[0]}']:
-                        self.int_values_repeat.append(f'ID{int_v[0]}')
-                self.int_values[f'ID{int_v[0]}'] = int_v[1:]
-        if has_overlap([TargetUB.NullPtrDeref], ALL_TARGET_UB):
-            ptr_values_ori = re.findall(r'PTR:([\-|\d]+):([\-|\w]+)', out)
-            self.ptr_values = {}
-            self.ptr_values_repeat = []
-            for ptr_v in ptr_values_ori:
-                if f'ID{ptr_v[0]}' in self.ptr_values:
-                    self.ptr_values_repeat.append(f'ID{ptr_v[0]}')
-                self.ptr_values[f'ID{ptr_v[0]}'] = ptr_v[1]
-        
-        if has_overlap([TargetUB.BufferOverflow, TargetUB.OutBound], ALL_TARGET_UB) > 0:
-            mem_range_ori = re.findall(r'GLOBAL:([\-|\d]+):([\-|\w]+):([\-|\d]+)', out)
-            self.mem_range_global = {}
-            for mem_v in mem_range_ori:
-                self.mem_range_global[int(mem_v[1], 16)] = int(mem_v[2])
-
-            mem_values_ori = re.findall(r'(LOCAL|MEM):([\-|\d]+):([\-|\w]+):([\-|\w]+)', out)
-            self.mem_range_local = []
-            self.mem_values = {}
-            self.mem_values_repeat = [] # record all mem_values indexs that have more than 1 access with different values
-            for mem_v in mem_values_ori:
-                if mem_v[0] == "LOCAL":
-                    self.mem_range_local.append([int(mem_v[2], 16),int(mem_v[3])])
-                    continue
-                access_mem = int(mem_v[2], 16)
-                access_size = int(mem_v[3], 16) - access_mem
-                tgt_mem_head, tgt_mem_size = access_mem, access_size
-                is_global = False
-                for mem_head in self.mem_range_global:
-                    if mem_head <= access_mem <= mem_head + self.mem_range_global[mem_head]-access_size:
-                        tgt_mem_head = mem_head
-                        tgt_mem_size = self.mem_range_global[mem_head]
-                        is_global = True
-                        break
-                is_local = False
-                if not is_global:
-                    for mem_i in range(len(self.mem_range_local)-1, -1, -1):
-                        mem_head, mem_size = self.mem_range_local[mem_i][0], self.mem_range_local[mem_i][1]
-                        if mem_head <= access_mem <= mem_head + mem_size-access_size:
-                            tgt_mem_head = mem_head
-                            tgt_mem_size = mem_size
-                            is_local = True
-                            break
-                if f'ID{mem_v[1]}' in self.mem_values: # record all mem_values that have more than 1 unique access address
-                    if access_mem != self.mem_values[f'ID{mem_v[1]}'][0]:
-                        self.mem_values_repeat.append(f'ID{mem_v[1]}')
-                self.mem_values[f'ID{mem_v[1]}'] = [access_mem, access_size, tgt_mem_head, tgt_mem_size, is_global, is_local]
-
-
-        # 5. static analysis: analyze all instrumentation sites
+        if TRACE_FORMAT != 'text':
+            if TRACE_FORMAT == 'summary':
+                tables.add_summary_records(load_binary_trace(trace_file))
+            else:
+                tables.add_records(load_binary_trace(trace_file))
+            if os.path.exists(trace_file):
+                os.remove(trace_file)
+        tables.finish()
+        self.analyze(filename, tables)
+
+    def analyze(self, filename, tables):
+        """
+        Step 5 of instrument: index the runtime trace `tables` of the
+        instrumented file and analyze all of its instrumentation sites
+        """
+        self.alive_sites = tables.alive_sites
+        self.alive_site_set = set(self.alive_sites) # for the INSERTIONSITE membership tests
+        # the *_repeat IDs are only tested for membership
+        self.int_values, self.int_values_repeat = tables.int_values, set(tables.int_values_repeat)
+        self.ptr_values, self.ptr_values_repeat = tables.ptr_values, set(tables.ptr_values_repeat)
+        self.mem_range_global, self.mem_range_local = tables.mem_range_global, tables.mem_range_local
+        self.mem_values, self.mem_values_repeat = tables.mem_values, set(tables.mem_values_repeat)
+
         with open(filename, 'r') as f:
             file_content = f.read()
         instr_info = re.findall(r'\/\*I\:([^\n]+)\:\*\/', file_content)
 
-        self.instrument_info = [] # each element of type: (InstrumentType, ID, )
+        self.instrument_info = InstrumentInfo() # records of the alive sites and of FUNCTIONENTER
         self.heap_vars = [[],[]] # all heap variables [[var_expr], [array_dim]]
-        self.array_vars = [] # all array variables
+        self.array_vars = set() # all array variables
         self.scope_tree = ScopeTree("Init") # brace scopes
         self.scope_vardecl = {} # scope of vardecl
         self.scope_varref_pointer = {} # scope of varref pointer
@@ -314,68 +427,137 @@ class Synthesizer:
         curr_scope_node = self.scope_tree
         for ori_info in instr_info:
             info = ori_info.strip().split(':')
-            info_id, info_instrument = info[0], info[1]
+            info_instrument = info[1]
             if info_instrument == 'FUNCTIONENTER':
-                self.instrument_info.append([InstrumentType.FUNCTIONENTER])
-            elif info_instrument == 'BRACESTART':
+                self.instrument_info.append(InstrumentType.FUNCTIONENTER)
+                continue
+            if info_instrument == 'BRACESTART':
                 new_node = ScopeTree(info[0])
                 new_node.parent = curr_scope_node
                 curr_scope_node.children.append(new_node)
                 curr_scope_node = new_node
+                continue
             elif info_instrument == 'BRACEEND':
                 curr_scope_node = curr_scope_node.parent
+                continue
             elif info_instrument == 'VARDECLHEAP':
                 self.heap_vars[0].append(info[3]) # var_expr
                 self.heap_vars[1].append(info[4]) # array_dim
-            elif info_instrument == 'INSERTIONSITE':
-                if info_id in self.alive_sites:
+                continue
+            info_id = parse_id(info[0])
+            if info_instrument == 'INSERTIONSITE':
+                if info[0] in self.alive_site_set:
                     is_alive_site = 1
-                    self.instrument_info.append([InstrumentType.INSTRUMENTSITE, info_id])
+                    self.instrument_info.append(InstrumentType.INSTRUMENTSITE, info_id)
                 else:
                     is_alive_site = 0
                 self.scope_instr[info_id] = curr_scope_node
             if not is_alive_site:
                 continue
             elif info_instrument == 'VARDECL':
-                self.instrument_info.append([InstrumentType.VARDECL, info_id, info[2], info[3]]) # InstrumentType, ID, type, var
+                self.instrument_info.append(InstrumentType.VARDECL, info_id, info[2], info[3]) # type, var
                 self.vardecl_id[info[3]] = info_id
                 self.scope_vardecl[info_id] = curr_scope_node
                 if '[' in info[2]:
-                    self.array_vars.append(info[3])
+                    self.array_vars.add(info[3])
             elif info_instrument == 'VARREF_POINTER':
-                self.instrument_info.append([InstrumentType.VARREF_POINTER, info_id, info[2], info[3]]) # InstrumentType, ID, type, var
+                self.instrument_info.append(InstrumentType.VARREF_POINTER, info_id, info[2], info[3]) # type, var
                 self.scope_varref_pointer[info_id] = curr_scope_node
             elif info_instrument == 'VARREF_POINTERINDEX':
-                self.instrument_info.append([InstrumentType.VARREF_POINTERINDEX, info_id, info[2], info[3]]) # InstrumentType, ID, type, var
+                self.instrument_info.append(InstrumentType.VARREF_POINTERINDEX, info_id, info[2], info[3]) # type, var
                 self.scope_varref_pointer[info_id] = curr_scope_node
             elif info_instrument == 'VARREF_ARRAY':
-                self.instrument_info.append([InstrumentType.VARREF_ARRAY, info_id, info[2], info[3], info[4]]) # InstrumentType, ID, type, var_arr, var_idx
+                self.instrument_info.append(InstrumentType.VARREF_ARRAY, info_id, info[2], info[3], rhs_expr=info[4]) # type, var_arr, var_idx
                 self.scope_varref_array[info_id] = curr_scope_node
             elif info_instrument == 'VARREF_MEMORY':
-                self.instrument_info.append([InstrumentType.VARREF_MEMORY, info_id, info[2], info[3]]) # InstrumentType, ID, type, var
+                self.instrument_info.append(InstrumentType.VARREF_MEMORY, info_id, info[2], info[3]) # type, var
                 self.scope_varref_array[info_id] = curr_scope_node
             elif info_instrument == 'VARREF_INTEGER':
-                self.instrument_info.append([InstrumentType.VARREF_INTEGER, info_id, info[2], info[3], info[4], info[5], info[6]]) # InstrumentType, ID, type of lhs, lhs, type of rhs, rhs
+                self.instrument_info.append(InstrumentType.VARREF_INTEGER, info_id, info[2], info[3], info[4], info[5], info[6]) # type of lhs, lhs, type of rhs, rhs, opcode
                 self.scope_varref_integer[info_id] = curr_scope_node
             elif info_instrument == 'VARREF_ASSIGN':
-                self.instrument_info.append([InstrumentType.VARREF_ASSIGN, info_id, info[2], info[3]]) # InstrumentType, ID, type, var
+                self.instrument_info.append(InstrumentType.VARREF_ASSIGN, info_id, info[2], info[3]) # type, var
             elif info_instrument == 'VARREF_FREE':
-                self.instrument_info.append([InstrumentType.VARREF_FREE, info_id, info[2], info[3]]) # InstrumentType, ID, type, var
+                self.instrument_info.append(InstrumentType.VARREF_FREE, info_id, info[2], info[3]) # type, var
             elif info_instrument == 'VARREF_INIT':
-                self.instrument_info.append([InstrumentType.VARREF_INIT, info_id, info[2], info[3]]) # InstrumentType, ID, type, var
+                self.instrument_info.append(InstrumentType.VARREF_INIT, info_id, info[2], info[3]) # type, var
                 self.scope_varref_init[info_id] = curr_scope_node
             else:
                 continue
+        self.scope_tree.number()
+        self.func_index = FunctionIndex(self.instrument_info)
         return
 
+    def run_pipeline(self, filename, mode, add_integer, add_arrayindex, stack_to_heap):
+        """
+        Instrument file with TOOL_PIPELINE, through the server of this process
+        if it can be used and with a process of its own otherwise
+        """
+        n_pass = 2 + add_integer + add_arrayindex + stack_to_heap
+        mut_prob = re.findall(r'--mutate-prob[ =](\d+)', self.config.tool_stacktoheap) # same options as the stacktoheap tool
+        mut_prob = int(mut_prob[0]) if mut_prob else 50
+        ret = None
+        if INSTRUMENT_SERVER:
+            server = get_instrument_server([TOOL_PIPELINE, '--server', '--', '-w'] + TOOL_COMPILE_ARGS.split())
+            ret = server.request({
+                'file': os.path.abspath(filename),
+                'mode': mode,
+                'integer': add_integer,
+                'arrayindex': add_arrayindex,
+                'stacktoheap': stack_to_heap,
+                'mutate_prob': mut_prob,
+                'trace': TRACE_FORMAT,
+            }, INSTRUMENT_TIMEOUT*n_pass)
+        if ret is None: # no server: one process per seed
+            cmd = f'{TOOL_PIPELINE} {filename} --mode={mode} --trace={TRACE_FORMAT}'
+            if add_integer:
+                cmd += ' --integer'
+            if add_arrayindex:
+                cmd += ' --arrayindex'
+            if stack_to_heap:
+                cmd += f' --stacktoheap --mutate-prob {mut_prob}'
+            cmd += f' -- -w {TOOL_COMPILE_ARGS}'
+            ret = run_cmd(cmd, INSTRUMENT_TIMEOUT*n_pass)
+        return ret
+
+    def instrument_tools(self, filename, mode, add_integer, add_arrayindex, stack_to_heap):
+        """
+        Instrument file with one clang-tool process per pass
+        """
+        # 1. add braces
+        cmd = f'{TOOL_ADDBRACES} {filename} -- -w {TOOL_COMPILE_ARGS}'
+        ret, out = run_cmd(cmd, INSTRUMENT_TIMEOUT)
+        if ret != 0:
+            raise InstrumentError(f"TOOL_ADDBRACES failed : {out}.")
+
+        # 2. add necessary extra information
+        if add_integer:
+            cmd = f'{TOOL_ADDINTEGER} {filename} -- -w {TOOL_COMPILE_ARGS}'
+            ret, out = run_cmd(cmd, INSTRUMENT_TIMEOUT)
+            if ret != 0:
+                raise InstrumentError(f"TOOL_ADDINTEGER failed : {out}.")
+        if add_arrayindex:
+            cmd = f'{TOOL_ADDARRAYINDEX} {filename} -- -w {TOOL_COMPILE_ARGS}'
+            ret, out = run_cmd(cmd, INSTRUMENT_TIMEOUT)
+            if ret != 0:
+                raise InstrumentError(f"TOOL_ADDARRAYINDEX failed : {out}.")
+
+        # 3. instrument
+        cmd = f'{TOOL_INSTRUMENTER} {filename} --mode={mode} --trace={TRACE_FORMAT} -- -w {TOOL_COMPILE_ARGS}'
+        ret, out = run_cmd(cmd, INSTRUMENT_TIMEOUT)
+        if ret != 0:
+            raise InstrumentError(f"TOOL_INSTRUMENTER failed : {out}.")
+
+        # stack to heap
+        if stack_to_heap:
+            cmd = f'{self.config.tool_stacktoheap} {filename} -- -w {TOOL_COMPILE_ARGS}'
+            ret, out = run_cmd(cmd, INSTRUMENT_TIMEOUT)
+            if ret != 0:
+                raise InstrumentError(f"TOOL_STACKTOHEAP failed : {out}.")
+
     def is_child_scope(self, src_scope, tgt_scope):
         # if src_scope is a (grand)child of tgt_scope
-        for child in tgt_scope.children:
-            if child.id == src_scope.id:
-                return True
-            if self.is_child_scope(src_scope, child):
-                return True
-        return False
+        return tgt_scope.enter < src_scope.enter <= tgt_scope.exit
 
     def is_out_scope(self, src_vardecl, tgt_var_expr, tgt_ins_type):
         # Is src_vardecl(vardecl) a (grand)child of tgt_var_expr(varref)
@@ -391,25 +573,22 @@ class Synthesizer:
 
     def insert(self, selected_info_idx):
         """
-        Mutate the selected_var in one of the valid instrumentation sites
+        Mutate the selected_var in one of the valid instrumentation sites.
+        The mutation is recorded in self.edits as (start, end, text) against self.src_ori.
         """
-        assert (
-            self.instrument_info[selected_info_idx][0] == InstrumentType.VARREF_POINTER or
-            self.instrument_info[selected_info_idx][0] == InstrumentType.VARREF_POINTERINDEX or
-            self.instrument_info[selected_info_idx][0] == InstrumentType.VARREF_ARRAY or
-            self.instrument_info[selected_info_idx][0] == InstrumentType.VARREF_MEMORY or
-            self.instrument_info[selected_info_idx][0] == InstrumentType.VARREF_INTEGER or
-            self.instrument_info[selected_info_idx][0] == InstrumentType.VARREF_FREE or
-            self.instrument_info[selected_info_idx][0] == InstrumentType.VARREF_INIT )
+        self.edits = []
+        assert self.instrument_info.kinds[selected_info_idx] in VARREF_TYPES
 
         # target variable reference id
-        tgt_var_id = self.instrument_info[selected_info_idx][1]
+        tgt_var_id = self.instrument_info.ids[selected_info_idx]
+        # its key in the runtime trace tables
+        tgt_site = self.instrument_info.site(selected_info_idx)
         # target variable type
-        tgt_var_type = self.instrument_info[selected_info_idx][2]
+        tgt_var_type = self.instrument_info.types[selected_info_idx]
         # target instrument type
-        tgt_ins_type = self.instrument_info[selected_info_idx][0]
+        tgt_ins_type = self.instrument_info.kinds[selected_info_idx]
         # target variable expression
-        tgt_var_expr = self.instrument_info[selected_info_idx][3]
+        tgt_var_expr = self.instrument_info.exprs[selected_info_idx]
         # target variable name
         tgt_var_name = retrieve_vars(tgt_var_expr)
         if len(tgt_var_name) == 0:
@@ -441,23 +620,25 @@ class Synthesizer:
         # candidate UBs among the given target UBs
         CAND_TARGET_UB = []
         for ub in AVAIL_UB:
-            if ub in ALL_TARGET_UB:
+            if ub in self.target_ubs:
                 CAND_TARGET_UB.append(ub)
         if len(CAND_TARGET_UB) == 0:
             return 1
 
         # randomly select a target ub
         tgt_ub = random.choice(CAND_TARGET_UB)
+        # what the mutant records about itself, see synthesize_sources
+        self.mutation = {'ub': tgt_ub.name, 'site': tgt_site}
 
         if tgt_ub == TargetUB.BufferOverflow:
-            if tgt_var_id not in self.mem_values:
+            if tgt_site not in self.mem_values:
                 return 1
-            if tgt_var_id in self.mem_values_repeat: # avoid false positives if we are accessing buffers in a loop with changing addresses
+            if tgt_site in self.mem_values_repeat: # avoid false positives if we are accessing buffers in a loop with changing addresses
                 return 1
             # get accessed memory address
             # size of the point to value
             # get valid range of the accessed memory region (tgt_mem_head, tgt_mem_size)
-            access_mem, access_size, tgt_mem_head, tgt_mem_size, is_global, is_local = self.mem_values[tgt_var_id]
+            access_mem, access_size, tgt_mem_head, tgt_mem_size, is_global, is_local = self.mem_values[tgt_site]
             if access_size > 32: # for large buffers, we will exceed the redzone
                 return 1
             if not is_local and not is_global: # the memory is not found
@@ -470,20 +651,21 @@ class Synthesizer:
             else:
                 place_holder_new = f"+{overflow_access}"
             # get placeholder
-            place_holder = re.findall(r'(_MUT[\w]+\d+)', self.instrument_info[selected_info_idx][3])[-1]
-            self.src = re.sub(re.escape(f'{place_holder})'), f'{place_holder_new}/*UBFUZZ*/)', self.src)
+            place_holder = re.findall(r'(_MUT[\w]+\d+)', self.instrument_info.exprs[selected_info_idx])[-1]
+            self.edits += [(start, end, f'{place_holder_new}/*UBFUZZ*/') for start, end in self.marks.uses.get(place_holder, [])]
+            self.mutation.update(placeholder=place_holder, replacement=place_holder_new)
             return 0
         elif tgt_ub == TargetUB.OutBound:
             if retrieve_vars(tgt_var_expr)[0] not in self.array_vars:
                 return 1
-            if tgt_var_id not in self.mem_values:
+            if tgt_site not in self.mem_values:
                 return 1
-            # if tgt_var_id in self.mem_values_repeat: # avoid false positives if we are accessing buffers in a loop with changing addresses
+            # if tgt_site in self.mem_values_repeat: # avoid false positives if we are accessing buffers in a loop with changing addresses
                 # return 1
             # get accessed memory address
             # size of the point to value
             # get valid range of the accessed memory region (tgt_mem_head, tgt_mem_size)
-            access_mem, access_size, tgt_mem_head, tgt_mem_size, is_global, is_local = self.mem_values[tgt_var_id]
+            access_mem, access_size, tgt_mem_head, tgt_mem_size, is_global, is_local = self.mem_values[tgt_site]
             # if not is_local and not is_global: # the memory is not found
                 # return 1
             # calculate overflow/underflow size
@@ -493,8 +675,9 @@ class Synthesizer:
             underboud = random.randint(underflow_access, 2**31)
             place_holder_new = random.choice([f"+{overflow_access}", f"-{underflow_access}", f"+{overbound}", f"-{underboud}"])
             # get placeholder
-            place_holder = re.findall(r'(_MUT[\w]+\d+)', self.instrument_info[selected_info_idx][3])[-1]
-            self.src = re.sub(re.escape(f'{place_holder})'), f'{place_holder_new}/*UBFUZZ*/)', self.src)
+            place_holder = re.findall(r'(_MUT[\w]+\d+)', self.instrument_info.exprs[selected_info_idx])[-1]
+            self.edits += [(start, end, f'{place_holder_new}/*UBFUZZ*/') for start, end in self.marks.uses.get(place_holder, [])]
+            self.mutation.update(placeholder=place_holder, replacement=place_holder_new)
             return 0
 
         elif tgt_ub == TargetUB.UseAfterFree:
@@ -507,31 +690,31 @@ class Synthesizer:
             # malloc-ed array dim
             new_stmt = f'free({tgt_var_expr});//UBFUZZ'
         elif tgt_ub == TargetUB.MemoryLeak:
-            free_index = self.src.index(f'/*I:{tgt_var_id}:VARREF_FREE:')
-            first_half = self.src[:free_index]
-            second_half = self.src[free_index:]
-            self.src = first_half + second_half.replace('free_', '//UBFUZZ //free_', 1)
+            free_index = self.src_ori.find('free_', self.marks.frees[tgt_var_id])
+            if free_index != -1:
+                self.edits.append((free_index, free_index, '//UBFUZZ //'))
+            self.mutation['replacement'] = '//UBFUZZ //free_'
             return 0
         elif tgt_ub == TargetUB.NullPtrDeref:
-            if tgt_var_id in self.ptr_values_repeat: # avoid for loop
+            if tgt_site in self.ptr_values_repeat: # avoid for loop
                 return 1
             # select a pointer
             depth = 0 if '*' not in tgt_var_expr else random.randint(0, tgt_var_expr.count('*')-1)
             new_stmt = '*'*depth + f'{tgt_var_expr} = 0;//UBFUZZ'
         elif tgt_ub == TargetUB.IntegerOverflow:
-            if tgt_var_id in self.int_values_repeat: # avoid for loop
+            if tgt_site in self.int_values_repeat: # avoid for loop
                 return 1
             # get lhs and rhs values and types
-            lhs_v, rhs_v = [int(x) for x in self.int_values[tgt_var_id]]
-            lhs_t, rhs_t = self.instrument_info[selected_info_idx][2], self.instrument_info[selected_info_idx][4]
-            opcode = self.instrument_info[selected_info_idx][6]
+            lhs_v, rhs_v = [int(x) for x in self.int_values[tgt_site]]
+            lhs_t, rhs_t = self.instrument_info.types[selected_info_idx], self.instrument_info.rhs_types[selected_info_idx]
+            opcode = self.instrument_info.ops[selected_info_idx]
             assert get_primitive_type(lhs_t) == get_primitive_type(rhs_t)
             if lhs_t[0] == 'u' and (opcode == '+' or opcode == '-' or opcode == '*'): # unsigned integer overflow is not undefined behavior
                 return 1
             # get operator
             # get lhs and rhs placeholders
-            lhs_p = re.findall(r'(_INTOP[L|R]\d+)', self.instrument_info[selected_info_idx][3])[-1]
-            rhs_p = re.findall(r'(_INTOP[L|R]\d+)', self.instrument_info[selected_info_idx][5])[-1]
+            lhs_p = re.findall(r'(_INTOP[L|R]\d+)', self.instrument_info.exprs[selected_info_idx])[-1]
+            rhs_p = re.findall(r'(_INTOP[L|R]\d+)', self.instrument_info.rhs_exprs[selected_info_idx])[-1]
             # select target overflow value
             t_min, t_max = get_random_int(lhs_t, get_max_and_min=True)
             try:
@@ -593,19 +776,22 @@ class Synthesizer:
             # # This is to replace the MACRO placeholder with a constant value
             # self.src = re.sub(re.escape(f'{place_holder})'), f'{place_holder_new}/*UBFUZZ*/)', self.src)
             # This is to replace the MACRO placeholder with a global variable
-            self.src = re.sub(re.escape(f'#define {place_holder} '), f'#include <stdint.h>\n{get_primitive_type(rhs_t)} MUT_VAR = {place_holder_new}/*UBFUZZ*/;\n#define {place_holder} +(MUT_VAR) ', self.src)
+            self.edits += [(start, end, f'#include <stdint.h>\n{get_primitive_type(rhs_t)} MUT_VAR = {place_holder_new}/*UBFUZZ*/;\n#define {place_holder} +(MUT_VAR) ')
+                           for start, end in self.marks.defines.get(place_holder, [])]
+            self.mutation.update(placeholder=place_holder, replacement=place_holder_new)
             return 0
 
         elif tgt_ub == TargetUB.DivideZero:
             # get lhs and rhs values and types
-            _, rhs_v = [int(x) for x in self.int_values[tgt_var_id]]
-            _, rhs_t = self.instrument_info[selected_info_idx][2], self.instrument_info[selected_info_idx][4]
-            opcode = self.instrument_info[selected_info_idx][6]
+            _, rhs_v = [int(x) for x in self.int_values[tgt_site]]
+            _, rhs_t = self.instrument_info.types[selected_info_idx], self.instrument_info.rhs_types[selected_info_idx]
+            opcode = self.instrument_info.ops[selected_info_idx]
             assert opcode == '/' or opcode == '%'
-            rhs_p = re.findall(r'(_INTOP[L|R]\d+)', self.instrument_info[selected_info_idx][5])[-1]
+            rhs_p = re.findall(r'(_INTOP[L|R]\d+)', self.instrument_info.rhs_exprs[selected_info_idx])[-1]
             place_holder = rhs_p
             place_holder_new = f'-({rhs_v})'
-            self.src = re.sub(re.escape(f'{place_holder})'), f'{place_holder_new}/*UBFUZZ*/)', self.src)
+            self.edits += [(start, end, f'{place_holder_new}/*UBFUZZ*/') for start, end in self.marks.uses.get(place_holder, [])]
+            self.mutation.update(placeholder=place_holder, replacement=place_holder_new)
             return 0
 
         elif tgt_ub == TargetUB.UseAfterScope:
@@ -614,48 +800,39 @@ class Synthesizer:
             tgt_ptr_num = tgt_var_type.count('*') + tgt_var_type.count('[')
             tgt_type_base = retrieve_vars(tgt_var_type)[0]
             all_vars = []
-            for src_idx in range(selected_info_idx, 0, -1): # search backwards
-                src_instrumenttype = self.instrument_info[src_idx][0]
-                if src_instrumenttype == InstrumentType.VARREF_POINTER or \
-                   src_instrumenttype == InstrumentType.VARREF_ARRAY or \
-                   src_instrumenttype == InstrumentType.VARREF_INTEGER or \
-                   src_instrumenttype == InstrumentType.VARDECL :
-
-                    src_type = self.instrument_info[src_idx][2]
-                    src_ptr_num = src_type.count('*') + src_type.count('[')
-                    src_type_base = retrieve_vars(src_type)[0]
-                    src_var_expr = self.instrument_info[src_idx][3]
-                    # if tgt_type_base != src_type_base: # both should have the same type base (e.g., uint32_t)
-                    #     continue
-                    if '*' in src_type:
-                        # although pointer types are out of scope, the point-to var is not. see test4.c
-                        # {int a; int *c; {int *b=&a; c=b;} *c=1;}
-                        continue
-                    if tgt_var_expr == src_var_expr: # is the same variable
-                        continue
-                    if retrieve_vars(src_var_expr)[0] not in self.vardecl_id:
-                        continue # function parameters like foo(p_1, p_2)
-                    if not self.is_out_scope(self.vardecl_id[retrieve_vars(src_var_expr)[0]], tgt_var_id, tgt_ins_type): # vardecl of src_var should be (grand)child of tgt_var
-                        continue
-                    if src_ptr_num > tgt_ptr_num: #
-                        new_var = src_var_expr
-                        for _ in range(src_ptr_num-tgt_ptr_num):
-                            new_var = f'*({new_var})'
-                        all_vars.append(new_var)
-                        continue
-                    if src_ptr_num == tgt_ptr_num-1:
-                        new_var = src_var_expr
-                        for _ in range(tgt_ptr_num-src_ptr_num):
-                            new_var = f'&({new_var})'
-                        all_vars.append(new_var)
-                        continue
-                    if src_ptr_num == tgt_ptr_num:
-                        all_vars.append(src_var_expr)
-                        continue
-                elif src_instrumenttype == InstrumentType.FUNCTIONENTER:
-                    break
-                elif src_instrumenttype == InstrumentType.VARDECL and self.instrument_info[src_idx][3] == tgt_var_name:
-                    break
+            # search backwards over the var records of this function
+            for src_idx in self.func_index.function_values(selected_info_idx):
+                src_type = self.instrument_info.types[src_idx]
+                src_ptr_num = src_type.count('*') + src_type.count('[')
+                src_type_base = retrieve_vars(src_type)[0]
+                src_var_expr = self.instrument_info.exprs[src_idx]
+                # if tgt_type_base != src_type_base: # both should have the same type base (e.g., uint32_t)
+                #     continue
+                if '*' in src_type:
+                    # although pointer types are out of scope, the point-to var is not. see test4.c
+                    # {int a; int *c; {int *b=&a; c=b;} *c=1;}
+                    continue
+                if tgt_var_expr == src_var_expr: # is the same variable
+                    continue
+                if retrieve_vars(src_var_expr)[0] not in self.vardecl_id:
+                    continue # function parameters like foo(p_1, p_2)
+                if not self.is_out_scope(self.vardecl_id[retrieve_vars(src_var_expr)[0]], tgt_var_id, tgt_ins_type): # vardecl of src_var should be (grand)child of tgt_var
+                    continue
+                if src_ptr_num > tgt_ptr_num: #
+                    new_var = src_var_expr
+                    for _ in range(src_ptr_num-tgt_ptr_num):
+                        new_var = f'*({new_var})'
+                    all_vars.append(new_var)
+                    continue
+                if src_ptr_num == tgt_ptr_num-1:
+                    new_var = src_var_expr
+                    for _ in range(tgt_ptr_num-src_ptr_num):
+                        new_var = f'&({new_var})'
+                    all_vars.append(new_var)
+                    continue
+                if src_ptr_num == tgt_ptr_num:
+                    all_vars.append(src_var_expr)
+                    continue
             if len(all_vars) == 0:
                 return 1
             all_vars = list(set(all_vars))
@@ -668,159 +845,200 @@ class Synthesizer:
             out_scope_var = tgt_var_expr
 
             # index of current VARREF_INIT
-            init_index = self.src.index(f'/*I:{tgt_var_id}:VARREF_INIT:')
-            first_half = self.src[:init_index]
-            second_half = self.src[init_index:]
+            init_index = self.marks.inits[tgt_var_id]
             to_replace_expr = f'{tgt_var_expr}'
-            if second_half.find(to_replace_expr) == -1:
+            expr_index = self.src_ori.find(to_replace_expr, init_index)
+            if expr_index == -1:
                 return 1
-            self.src = first_half + second_half.replace(to_replace_expr, new_var, 2)
+            # the first two occurrences from the VARREF_INIT comment on
+            for _ in range(2):
+                if expr_index == -1:
+                    break
+                self.edits.append((expr_index, expr_index+len(to_replace_expr), new_var))
+                expr_index = self.src_ori.find(to_replace_expr, expr_index+len(to_replace_expr))
 
         # find all valid instrumentation sites
+        index = self.func_index
+        if tgt_ub == TargetUB.UseAfterScope:
+            out_scope_name = retrieve_vars(out_scope_var)[0]
+            # we've meet an assignment to our target expr, so we cannot proceed. see test5.c
+            stop_idx = index.site_stop(selected_info_idx, tgt_var_name, tgt_var_expr, out_scope_name)
+            src_var_scope = self.scope_vardecl[self.vardecl_id[out_scope_name]]
+        else:
+            stop_idx = index.site_stop(selected_info_idx, tgt_var_name)
+            if tgt_ub == TargetUB.UseUninit:
+                src_var_scope = self.scope_varref_init[tgt_var_id]
         valid_site_list = []
-        have_seen_INSTRUMENTSITE = False
-        for curr_idx in range(selected_info_idx-1, 0, -1): # search backwards
-            curr_instrumenttype = self.instrument_info[curr_idx][0]
-            if curr_instrumenttype == InstrumentType.VARREF_ASSIGN:
-                if tgt_ub == TargetUB.UseAfterScope:
-                    curr_var = self.instrument_info[curr_idx][3]
-                    if curr_var == tgt_var_expr:
-                        # we've meet an assignment to our target expr, so we cannot proceed. see test5.c
-                        break
-            elif curr_instrumenttype == InstrumentType.INSTRUMENTSITE:
-                have_seen_INSTRUMENTSITE = True
-                if tgt_ub == TargetUB.UseAfterScope:
-                    curr_instr_id = self.instrument_info[curr_idx][1]
-                    curr_instr_scope = self.scope_instr[curr_instr_id]
-                    src_var_scope = self.scope_vardecl[self.vardecl_id[retrieve_vars(out_scope_var)[0]]]
-                    if curr_instr_scope == src_var_scope or self.is_child_scope(curr_instr_scope, src_var_scope):
-                        valid_site_list.append(curr_idx)
-                    else:
-                        continue
-                elif tgt_ub == TargetUB.UseUninit:
-                    curr_instr_id = self.instrument_info[curr_idx][1]
-                    curr_instr_scope = self.scope_instr[curr_instr_id]
-                    src_var_scope = self.scope_varref_init[tgt_var_id]
-                    if curr_instr_scope == src_var_scope:# or not self.is_child_scope(curr_instr_scope, src_var_scope):
-                        valid_site_list.append(curr_idx)
-                    else:
-                        break
-                else:
+        for curr_idx in index.between(index.sites, stop_idx, selected_info_idx):
+            if tgt_ub == TargetUB.UseAfterScope:
+                curr_instr_scope = self.scope_instr[self.instrument_info.ids[curr_idx]]
+                if curr_instr_scope == src_var_scope or self.is_child_scope(curr_instr_scope, src_var_scope):
                     valid_site_list.append(curr_idx)
-            elif curr_instrumenttype == InstrumentType.VARREF_POINTER or \
-                curr_instrumenttype == InstrumentType.VARREF_ARRAY or \
-                    curr_instrumenttype == InstrumentType.VARREF_INTEGER:
-                if retrieve_vars(self.instrument_info[curr_idx][3])[0] == tgt_var_name:
-                    if have_seen_INSTRUMENTSITE:
-                        break
-            elif curr_instrumenttype == InstrumentType.VARDECL:
-                if retrieve_vars(self.instrument_info[curr_idx][3])[0] == tgt_var_name:
-                    break
-                if tgt_ub == TargetUB.UseAfterScope and self.instrument_info[curr_idx][3] == retrieve_vars(out_scope_var)[0]:
+            elif tgt_ub == TargetUB.UseUninit:
+                curr_instr_scope = self.scope_instr[self.instrument_info.ids[curr_idx]]
+                if curr_instr_scope == src_var_scope:# or not self.is_child_scope(curr_instr_scope, src_var_scope):
+                    valid_site_list.append(curr_idx)
+                else:
                     break
-            elif curr_instrumenttype == InstrumentType.FUNCTIONENTER:
-                break
+            else:
+                valid_site_list.append(curr_idx)
         if len(valid_site_list) == 0:
             return 1
 
-        if tgt_ub == TargetUB.BufferOverflow:
-            #don't use instrumentsites that are inside a loop
-            valid_site_list_copy = valid_site_list.copy()
-            start_site_id = self.instrument_info[valid_site_list[-1]][1]
-            end_site_id = self.instrument_info[valid_site_list[0]][1]
-            all_executed_sites = self.alive_sites[self.alive_sites.index(start_site_id):self.alive_sites.index(end_site_id)]
-            for idx in range(len(valid_site_list_copy)):
-                if all_executed_sites.count(self.instrument_info[valid_site_list_copy[idx]][1]) > 1:
-                    valid_site_list.remove(valid_site_list_copy[idx])
-                else:
-                    pass
-            #rename target MUT_ARR_id to avoid cleanup
-            if tgt_ins_type == InstrumentType.VARREF_ARRAY:
-                self.src = re.sub(self.instrument_info[selected_info_idx][4], 'MUT_ARR', self.src)
-                new_stmt = re.sub(self.instrument_info[selected_info_idx][4], 'MUT_ARR', new_stmt)
-            if tgt_ins_type == InstrumentType.VARREF_POINTERINDEX:
-                self.src = re.sub(self.instrument_info[selected_info_idx][3], 'MUT_PTR', self.src)
-                new_stmt = re.sub(self.instrument_info[selected_info_idx][3], 'MUT_PTR', new_stmt)
-
-
-
         # select an instrumentation site
         random.shuffle(valid_site_list)
         selected_site = random.choice(valid_site_list)
         # insert
-        self.src = self.src.replace(
-            f'/*I:{self.instrument_info[selected_site][1]}:INSERTIONSITE:*/',
-            new_stmt + ' /*I:')
+        self.edits += [(start, end, new_stmt + ' /*I:') for start, end in self.marks.sites.get(self.instrument_info.ids[selected_site], [])]
+        self.mutation.update(replacement=new_stmt, insertion_site=self.instrument_info.site(selected_site))
         return 0
 
     def clean_instrument(self):
         """
         Remove instrumentations
         """
-        self.src = re.sub(r'\/\*I:.*', '', self.src) # remove all instrumented comments
-        self.src = re.sub(r'int MUT_ARR_\d+ = 0;', '', self.src) # remove all MUT_ARR_id
-        self.src = re.sub(r'MUT_ARR_\d+\+', '', self.src) # remove all MUT_ARR_id
-        self.src = re.sub(r'int MUT_PTR_\d+ = 0;', '', self.src) # remove all MUT_ARR_id
-        self.src = re.sub(r'\+MUT_PTR_\d+', '', self.src) # remove all MUT_ARR_id
+        self.src = clean_source(self.src)
 
-    def synthesizer(self, filename, mutated_num=-1):
+    def synthesize_sources(self, filename, mutated_num=-1, as_bytes=False, seen=None, delta=False):
         """
         Synthesize a source file by replacing variables/constants with function calls.
+        With mutated_num > 0, stop after that many unique mutants; otherwise try every candidate.
+        Mutants are built and deduplicated in memory and returned as source strings (bytes if as_bytes),
+        or, with delta, as source_patch.Mutant edits of self.clean_base.clean that are built on demand.
+        `seen` is an optional set of mutant digests shared across seeds, e.g., a mutant_store.DigestSet;
+        mutants already in it are skipped and new ones are added.
+        self.mutants_info[i] describes mutant i: target UB, site ID and replacement.
+        Target UBs of more than one of UB_MODE_GROUPS go through synthesize_session.
         """
         random.seed()
+        if sum(has_overlap(group, self.target_ubs) for _, group in UB_MODE_GROUPS) > 1:
+            results = self.synthesize_session(filename, self.target_ubs, mutated_num, as_bytes, seen, delta)
+            self.mutants_info = [info for _, mutants_info in results.values() for info in mutants_info]
+            return [mutant for mutants, _ in results.values() for mutant in mutants]
+        self.instrument_seed(filename)
+        return self.synthesize_mutants(mutated_num, as_bytes, seen, delta)
 
+    def synthesize_session(self, filename, target_ubs, mutated_num=-1, as_bytes=False, seen=None, delta=False) -> dict:
+        """
+        synthesize_sources for several target UBs of one seed, instrumenting it
+        once per group of UB_MODE_GROUPS instead of once per UB; the UBs of a
+        group share the instrumentation and trace of the whole group.
+        Returns {UB name: (mutants, mutants_info)}; the UBs of a group whose
+        instrumentation failed get no mutants and self.session_errors[UB name] is the error.
+        """
+        random.seed()
+        results = {}
+        self.session_errors = {}
+        target_ubs_saved = self.target_ubs
+        try:
+            for _, group in UB_MODE_GROUPS:
+                group_ubs = [ub for ub in target_ubs if ub in group]
+                if len(group_ubs) == 0:
+                    continue
+                self.target_ubs = group_ubs
+                try:
+                    self.instrument_seed(filename)
+                except InstrumentError as e:
+                    for ub in group_ubs:
+                        results[ub.name] = ([], [])
+                        self.session_errors[ub.name] = e
+                    continue
+                for ub in group_ubs:
+                    self.target_ubs = [ub]
+                    mutants = self.synthesize_mutants(mutated_num, as_bytes, seen, delta)
+                    results[ub.name] = (mutants, self.mutants_info)
+        finally:
+            self.target_ubs = target_ubs_saved
+        return results
+
+    def instrument_seed(self, filename):
+        """
+        Steps 1-2 of synthesize_sources: instrument a copy of filename for
+        self.target_ubs and index the instrumented source.
+        """
         assert '.c' in filename
         realname = re.findall(r'([\w|_]+\.c)', filename)[0]
-        # 1. backup file
-        if self.tmp_dir is None:
-            file_instrument = filename.replace(realname, 'instrument_'+realname)
-        else:
-            file_instrument = os.path.join(self.tmp_dir, 'instrument_'+realname)
+        # 1. backup file, the clang tools instrument it in place; the name is unique
+        # so that synthesizers of other targets can instrument the same seed concurrently
+        instrument_dir = self.tmp_dir if self.tmp_dir is not None else os.path.dirname(os.path.abspath(filename))
+        fd, file_instrument = tempfile.mkstemp(prefix='instrument_', suffix='_'+realname, dir=instrument_dir)
+        os.close(fd)
         shutil.copyfile(filename, file_instrument)
         # 2. instrumentation
-        self.instrument(file_instrument)
-        with open(file_instrument, "r") as f:
-            self.src_ori = f.read()
+        try:
+            self.instrument(file_instrument)
+            with open(file_instrument, "r") as f:
+                self.src_ori = f.read()
+            self.marks = MarkerIndex(self.src_ori)
+            self.clean_base = CleanBase(self.src_ori) # clean once, re-clean only the edited lines of a mutant
+        finally:
+            os.remove(file_instrument)
+
+    def synthesize_mutants(self, mutated_num=-1, as_bytes=False, seen=None, delta=False):
+        """
+        Step 3 of synthesize_sources: the mutants of the last instrument_seed()
+        for self.target_ubs, which may be a part of the UBs it was instrumented for.
+        """
         # 3. sythesis
-        all_mutated_file = []
-        all_mutated_file_md5 = []
-        mutated_n = 0
+        all_mutants = []
+        self.mutants_info = []
+        all_mutants_edits = set() # the edits in the clean base, equal edits are equal mutants
+        all_mutants_digest = set() # content digests, for different edits giving the same mutant
         var_idx_list = []
         for i in range(len(self.instrument_info)):
-            info_type = self.instrument_info[i][0]
-            if info_type in [InstrumentType.VARREF_POINTER, InstrumentType.VARREF_POINTERINDEX, InstrumentType.VARREF_ARRAY, InstrumentType.VARREF_MEMORY, InstrumentType.VARREF_INTEGER, InstrumentType.VARREF_FREE, InstrumentType.VARREF_INIT]:
+            if self.instrument_info.kinds[i] in VARREF_TYPES:
                 var_idx_list.append(i)
+        if mutated_num > 0:
+            # budgeted: visit candidates in random order and stop at mutated_num unique mutants
+            random.shuffle(var_idx_list)
         for selected_var_idx in var_idx_list:
-            mutated_filename = f'mutated_{mutated_n}_{realname}'
-            if self.tmp_dir is None:
-                mutated_file = filename.replace(realname, mutated_filename)
-            else:
-                mutated_file = os.path.join(self.tmp_dir, mutated_filename)
-            shutil.copyfile(file_instrument, mutated_file)
-            self.src = deepcopy(self.src_ori)
-            insert_succ = False
+            if mutated_num > 0 and len(all_mutants) >= mutated_num:
+                break
             # insert function to selected site
             ret = self.insert(selected_var_idx)
-            if ret == 0:
-                insert_succ = True
-            if not insert_succ:
-                os.remove(mutated_file)
+            if ret != 0:
+                continue
+            clean_edits = tuple(self.clean_base.clean_edits(self.edits))
+            if clean_edits in all_mutants_edits:
+                continue
+            all_mutants_edits.add(clean_edits)
+            curr_digest = self.clean_base.digest(clean_edits)
+            if curr_digest in all_mutants_digest:
                 continue
-            self.clean_instrument()
-            if has_overlap([TargetUB.UseUninit], ALL_TARGET_UB):
-                if self.src.count('UNINIT') != 2:# a workaround when only uninit decl is inserted.
-                    os.remove(mutated_file)
+            all_mutants_digest.add(curr_digest)
+            mutant = Mutant(self.clean_base.clean, clean_edits, curr_digest)
+            if has_overlap([TargetUB.UseUninit], self.target_ubs):
+                if mutant.count('UNINIT') != 2:# a workaround when only uninit decl is inserted.
                     continue
-            curr_md5 = hashlib.md5(self.src.encode("utf-8")).hexdigest()
-            if curr_md5 in all_mutated_file_md5:
-                os.remove(mutated_file)
+            if seen is not None:
+                if curr_digest in seen:
+                    continue
+                seen.add(curr_digest)
+            if delta:
+                all_mutants.append(mutant)
+                self.mutants_info.append(self.mutation)
                 continue
-            all_mutated_file_md5.append(curr_md5)
+            self.src = mutant.materialize()
+            all_mutants.append(self.src.encode("utf-8") if as_bytes else self.src)
+            self.mutants_info.append(self.mutation)
+        return all_mutants
+
+    def synthesizer(self, filename, mutated_num=-1):
+        """
+        Same as synthesize_sources, but writes each mutant next to filename
+        (or into tmp_dir) and returns the file names.
+        """
+        realname = re.findall(r'([\w|_]+\.c)', filename)[0]
+        all_mutated_file = []
+        for mutated_n, mutant in enumerate(self.synthesize_sources(filename, mutated_num)):
+            mutated_filename = f'mutated_{mutated_n}_{realname}'
+            if self.tmp_dir is None:
+                mutated_file = filename.replace(realname, mutated_filename)
+            else:
+                mutated_file = os.path.join(self.tmp_dir, mutated_filename)
             with open(mutated_file, "w") as f:
-                f.write(self.src)
+                f.write(mutant)
             all_mutated_file.append(mutated_file)
-            mutated_n += 1
-        os.remove(file_instrument)
         return all_mutated_file
 
 
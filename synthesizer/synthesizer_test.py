@@ -12,7 +12,7 @@ syner = Synthesizer(
 
 def run_sanitizer(src):
     try:
-        process = sp.run(f'{CC} {COMPILE_ARGS} -w -O0 {src} -fsanitize=address -o test.out'.split(' '), capture_output=True, timeout=5)
+        process = sp.run(f'{CC} {INCLUDE_ARGS} -w -O0 {src} -fsanitize=address -o test.out'.split(' '), capture_output=True, timeout=5)
     except:
         return -1
     if process.returncode != 0:
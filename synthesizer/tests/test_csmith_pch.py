@@ -0,0 +1,31 @@
+import unittest
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import config
+from config import csmith_pch_args, csmith_pch_path
+import tempfile
+from unittest import mock
+
+class TestCsmithPch(unittest.TestCase):
+    def test_pch_args(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+             mock.patch.object(config, 'CSMITH_INCLUDE', tmp_dir), mock.patch.object(config, 'CSMITH_PCH_DIR', tmp_dir):
+            header, pch = os.path.join(tmp_dir, 'csmith.h'), csmith_pch_path('cc')
+            self.assertEqual(csmith_pch_args('cc'), '') # neither
+            open(header, 'w').close()
+            self.assertEqual(csmith_pch_args('cc'), '') # not built yet
+            open(pch, 'w').close()
+            os.utime(header, (1000, 1000))
+            os.utime(pch, (2000, 2000))
+            self.assertEqual(csmith_pch_args('cc'), f' -include-pch {pch} ')
+            self.assertEqual(csmith_pch_args('check'), '') # each kind of compile has its own
+            os.utime(header, (3000, 3000)) # csmith.h changed since
+            self.assertEqual(csmith_pch_args('cc'), '')
+            os.utime(pch, (3000, 3000))
+            self.assertEqual(csmith_pch_args('cc'), f' -include-pch {pch} ')
+            os.remove(header)
+            self.assertEqual(csmith_pch_args('cc'), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
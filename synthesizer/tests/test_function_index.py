@@ -0,0 +1,93 @@
+import unittest
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from synthesizer import *
+
+NAMES = ['l_1', 'l_2', 'l_3', 'p_4']
+EXPRS = NAMES + ['*l_1', '*(p_4)', 'l_2[1]', 'l_3[l_1]']
+TYPES = ['int32_t', 'uint8_t', 'int32_t *', 'int32_t[4]', 'int16_t[2][3]']
+
+def random_info(rng, size):
+    # a few functions of var, assignment and site records in random order
+    kinds = [InstrumentType.INSTRUMENTSITE] * 4 + [InstrumentType.VARREF_ASSIGN, InstrumentType.VARREF_FREE,
+        InstrumentType.VARREF_POINTER, InstrumentType.VARREF_ARRAY, InstrumentType.VARREF_INTEGER, InstrumentType.VARDECL]
+    info = InstrumentInfo()
+    info.append(InstrumentType.FUNCTIONENTER)
+    for i in range(1, size):
+        if rng.random() < 0.02:
+            info.append(InstrumentType.FUNCTIONENTER)
+            continue
+        kind = rng.choice(kinds)
+        expr = rng.choice(NAMES) if kind == InstrumentType.VARDECL else rng.choice(EXPRS)
+        info.append(kind, i, rng.choice(TYPES), expr)
+    return info
+
+class TestFunctionIndex(unittest.TestCase):
+    def scan_sites(self, info, idx, var_name, assign_expr=None, decl_expr=None):
+        # the backward scan of insert that site_stop replaces
+        sites = []
+        have_seen_INSTRUMENTSITE = False
+        for curr_idx in range(idx-1, 0, -1):
+            kind = info.kinds[curr_idx]
+            if kind == InstrumentType.VARREF_ASSIGN:
+                if assign_expr is not None and info.exprs[curr_idx] == assign_expr:
+                    break
+            elif kind == InstrumentType.INSTRUMENTSITE:
+                have_seen_INSTRUMENTSITE = True
+                sites.append(curr_idx)
+            elif kind in (InstrumentType.VARREF_POINTER, InstrumentType.VARREF_ARRAY, InstrumentType.VARREF_INTEGER):
+                if retrieve_vars(info.exprs[curr_idx])[0] == var_name and have_seen_INSTRUMENTSITE:
+                    break
+            elif kind == InstrumentType.VARDECL:
+                if retrieve_vars(info.exprs[curr_idx])[0] == var_name:
+                    break
+                if decl_expr is not None and info.exprs[curr_idx] == decl_expr:
+                    break
+            elif kind == InstrumentType.FUNCTIONENTER:
+                break
+        return sites
+
+    def scan_values(self, info, idx):
+        # the backward scan of the UseAfterScope var search that function_values replaces
+        values = []
+        for src_idx in range(idx, 0, -1):
+            kind = info.kinds[src_idx]
+            if kind in (InstrumentType.VARREF_POINTER, InstrumentType.VARREF_ARRAY, InstrumentType.VARREF_INTEGER, InstrumentType.VARDECL):
+                values.append(src_idx)
+            elif kind == InstrumentType.FUNCTIONENTER:
+                break
+        return values
+
+    def test_function_values(self):
+        rng = random.Random(2)
+        for _ in range(20):
+            info = random_info(rng, rng.randrange(2, 400))
+            index = FunctionIndex(info)
+            for idx in range(1, len(info)):
+                if info.kinds[idx] in VARREF_TYPES: # the records insert mutates
+                    self.assertEqual(index.function_values(idx), self.scan_values(info, idx))
+
+    def test_site_stop(self):
+        rng = random.Random(0)
+        for _ in range(20):
+            info = random_info(rng, rng.randrange(2, 400))
+            index = FunctionIndex(info)
+            for _ in range(100):
+                idx = rng.randrange(1, len(info))
+                var_name = rng.choice(NAMES)
+                assign_expr, decl_expr = rng.choice([(None, None), (rng.choice(EXPRS), rng.choice(NAMES))])
+                stop_idx = index.site_stop(idx, var_name, assign_expr, decl_expr)
+                self.assertEqual(index.between(index.sites, stop_idx, idx), self.scan_sites(info, idx, var_name, assign_expr, decl_expr))
+
+    def test_last_before(self):
+        rng = random.Random(1)
+        for _ in range(200):
+            positions = sorted(rng.sample(range(100), rng.randrange(0, 30)))
+            idx = rng.randrange(0, 110)
+            self.assertEqual(FunctionIndex.last_before(positions, idx), max([p for p in positions if p < idx], default=-1))
+            lo, hi = sorted(rng.sample(range(-1, 110), 2))
+            self.assertEqual(FunctionIndex.between(positions, lo, hi), [p for p in positions[::-1] if lo < p < hi])
+
+
+if __name__ == '__main__':
+    unittest.main()
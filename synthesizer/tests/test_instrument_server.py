@@ -0,0 +1,87 @@
+import unittest
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from instrument_server import *
+import synthesizer
+from synthesizer import Synthesizer
+import tempfile, stat
+from unittest import mock
+
+# a stand-in for tool-ubgen-pipeline: the server replies as $FAKE_SERVER says,
+# a per-file run only logs the file it was given
+FAKE_PIPELINE = '''#!/bin/sh
+if [ "$1" = --server ]; then
+    while read l; do
+        case "$FAKE_SERVER" in
+            garbage) echo 'clang: warning: argument unused';;
+            dead) exit 1;;
+            *) echo '{"ok": true}';;
+        esac
+    done
+    exit 0
+fi
+echo "$1" >> "$FAKE_LOG"
+'''
+
+class TestInstrumentServer(unittest.TestCase):
+    def test_reply(self):
+        server = InstrumentServer(['sh', '-c', 'while read l; do echo \'{"ok": true}\'; done'])
+        self.assertEqual(server.request({'file': 'a.c'}), (0, ''))
+        self.assertEqual(server.request({'file': 'b.c'}), (0, ''))
+        server.stop()
+
+    def test_garbage_reply(self):
+        # anything but a JSON reply falls back to the subprocess tools
+        for reply in ['clang: warning: argument unused', '{"ok": tr', '42']:
+            server = InstrumentServer(['sh', '-c', f'read l; echo \'{reply}\'; sleep 5'])
+            self.assertIsNone(server.request({'file': 'a.c'}))
+            self.assertIsNone(server.process)
+
+    def test_dead_server(self):
+        server = InstrumentServer(['sh', '-c', 'read l'])
+        self.assertIsNone(server.request({'file': 'a.c'}))
+
+    def test_fork(self):
+        # a forked worker starts a server of its own and leaves the parent's alone
+        cmd = ['sh', '-c', 'while read l; do echo \'{"ok": true}\'; done']
+        server = get_instrument_server(cmd)
+        self.addCleanup(server.stop)
+        self.assertIs(get_instrument_server(cmd), server)
+        self.assertEqual(server.request({'file': 'a.c'}), (0, ''))
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            child = get_instrument_server(cmd)
+            ok = child is not server and child.request({'file': 'b.c'}) == (0, '') and child.process.pid != server.process.pid
+            stop_instrument_servers() # what atexit runs in the worker
+            os.write(w, b'1' if ok else b'0')
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(os.read(r, 1), b'1')
+        os.close(r)
+        os.close(w)
+        self.assertIsNone(server.process.poll())
+        self.assertEqual(server.request({'file': 'c.c'}), (0, ''))
+
+    def test_pipeline_fallback(self):
+        # garbage from the server or a dead server: the file goes to a pipeline process of its own
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pipeline, log, src = [os.path.join(tmp_dir, name) for name in ['pipeline', 'log', 'seed.c']]
+            with open(pipeline, 'w') as f:
+                f.write(FAKE_PIPELINE)
+            os.chmod(pipeline, os.stat(pipeline).st_mode | stat.S_IEXEC)
+            open(log, 'w').close()
+            syner = Synthesizer(100, tmp_dir)
+            with mock.patch.object(synthesizer, 'TOOL_PIPELINE', pipeline), mock.patch.dict(os.environ, FAKE_LOG=log):
+                stop_instrument_servers()
+                # each failure kills the server, so every request starts one that reads $FAKE_SERVER anew
+                for reply, forks in [('garbage', 1), ('dead', 2), ('ok', 2), ('ok', 2)]:
+                    os.environ['FAKE_SERVER'] = reply
+                    self.assertEqual(syner.run_pipeline(src, 'int', True, False, False), (0, ''))
+                    with open(log) as f:
+                        self.assertEqual(f.read().split(), [src] * forks)
+                stop_instrument_servers()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from mutant_store import *
+from source_patch import Mutant, diff_edit
+import tempfile
+
+class TestMutantStore(unittest.TestCase):
+    def test_digest_set(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'digests')
+            seen = DigestSet(path)
+            self.assertTrue(seen.add_mutant('int main() { return 0; }'))
+            self.assertFalse(seen.add_mutant(b'int main() { return 0; }'))
+            self.assertTrue(seen.add_mutant('int main() { return 1; }'))
+            seen.close()
+            with open(path, 'ab') as f:
+                f.write(b'\0' * 3) # cut off by a killed run
+            seen = DigestSet(path)
+            self.assertEqual(len(seen), 2)
+            self.assertIn(mutant_digest('int main() { return 1; }'), seen)
+            self.assertFalse(seen.add_mutant('int main() { return 0; }'))
+            seen.close()
+
+    def test_corpus_store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = CorpusStore(tmp_dir)
+            self.assertTrue(store.put('int a;', seed='00', ub='NullPtrDeref', site='ID3', replacement='a = 0;//UBFUZZ'))
+            self.assertFalse(store.put(b'int a;', seed='11'))
+            self.assertTrue(store.put('int b;', seed='00'))
+            store.close()
+            store = CorpusStore(tmp_dir) # a second run into the same store
+            self.assertFalse(store.put('int b;', seed='22'))
+            store.close()
+            records = list(read_index(tmp_dir))
+            self.assertEqual(len(records), 2)
+            self.assertEqual(records[0]['digest'], mutant_digest('int a;').hex())
+            self.assertEqual(records[0]['ub'], 'NullPtrDeref')
+            self.assertEqual(records[0]['site'], 'ID3')
+            with open(os.path.join(tmp_dir, records[0]['path'])) as f:
+                self.assertEqual(f.read(), 'int a;')
+            self.assertEqual(os.path.dirname(records[0]['path']), records[0]['digest'][:2])
+
+    def test_pack(self):
+        base = 'int a;\nint main() { return a; }\n'
+        mutants = [base.replace('return a', 'return a/0'), base.replace('int a;', 'int a[2];'), 'int b;\n']
+        for compression in [None, 'gzip']:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, 'mutants.pack')
+                pack = PackWriter(path, compression)
+                pack.put(mutants[0], seed='00', base=base, ub='DivideZero', site='ID3')
+                pack.put(mutants[1].encode('utf-8'), seed='00', base=base)
+                pack.close()
+                pack = PackWriter(path) # a second run keeps the compression
+                pack.put(mutants[2], seed='11')
+                pack.put(Mutant(base, [diff_edit(base, mutants[0])]), seed='00')
+                pack.close()
+                self.assertEqual(pack_compression(path), compression)
+                records = list(read_pack(path))
+                self.assertEqual([text for _, text in records], mutants + mutants[:1])
+                self.assertEqual(records[0][0]['ub'], 'DivideZero')
+                self.assertEqual(records[0][0]['digest'], mutant_digest(mutants[0]).hex())
+                self.assertNotIn('base', records[0][0])
+                with open(path, 'ab') as f:
+                    f.write(b'\2\0') # cut off by a killed run
+                self.assertEqual(len(list(read_pack(path))), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
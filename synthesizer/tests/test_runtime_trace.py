@@ -0,0 +1,123 @@
+import unittest
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from runtime_trace import *
+import tempfile, random
+
+class TestRuntimeTrace(unittest.TestCase):
+    text_trace = (
+        "GLOBAL:0:0x1000:16\n"
+        "LOCAL:1:0x2000:12\n"
+        "INST:7\n"
+        "MEM:2:0x1004:0x1008\n"
+        "MEM:3:0x2008:0x200c\n"
+        "LOCAL:1:0x3000:12\n"
+        "MEM:3:0x3008:0x300c\n"
+        "PTR:4:(nil)\n"
+        "PTR:4:0x1000\n"
+        "INT:5:-5:18446744073709551615\n"
+        "INT:5:-5:18446744073709551615\n"
+        "INST:8\n"
+    )
+
+    def get_tables(self, add):
+        tables = TraceTables()
+        add(tables)
+        tables.finish()
+        return tables
+
+    def test_text(self):
+        tables = self.get_tables(lambda t: t.add_text(self.text_trace))
+        self.assertEqual(tables.alive_sites, ['ID7', 'ID8'])
+        self.assertEqual(tables.int_values, {'ID5': (-5, 18446744073709551615)})
+        self.assertEqual(tables.int_values_repeat, [])
+        self.assertEqual(tables.ptr_values, {'ID4': '0x1000'})
+        self.assertEqual(tables.mem_values['ID2'], [0x1004, 4, 0x1000, 16, True, False])
+        self.assertEqual(tables.mem_values['ID3'], [0x3008, 4, 0x3000, 12, False, True])
+        self.assertEqual(tables.mem_values_repeat, ['ID3'])
+
+    def test_binary_matches_text(self):
+        records = []
+        for event in TEXT_EVENT.finditer(self.text_trace):
+            record = text_event_to_record(*event.groups())
+            if record is not None:
+                records.append(record)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            trace_file = os.path.join(tmp_dir, 'test.trace')
+            with open(trace_file, 'wb') as f:
+                f.write(np.array(records, dtype=TRACE_RECORD).tobytes())
+                f.write(b'\0' * 5) # truncated last record
+            binary = self.get_tables(lambda t: t.add_records(load_binary_trace(trace_file)))
+        text = self.get_tables(lambda t: t.add_text(self.text_trace))
+        for attr in ['alive_sites', 'int_values', 'int_values_repeat', 'ptr_values', 'ptr_values_repeat',
+                     'mem_range_global', 'mem_range_local', 'mem_values', 'mem_values_repeat']:
+            self.assertEqual(getattr(binary, attr), getattr(text, attr))
+
+    def test_summary(self):
+        records = np.array([
+            (TRACE_INST_HIT, 8, 4, 0),
+            (TRACE_INST_HIT, 7, 1, 0),
+            (TRACE_INST_HIT, 7, 3, 0),
+            (TRACE_INT | TRACE_RHS_UNSIGNED | TRACE_CHANGED, 5, (-5) & U64_MASK, 3),
+            (TRACE_INT, 6, 1, 2),
+            (TRACE_GLOBAL, 0, 0x1000, 16),
+            (TRACE_MEM, 2, 0x1004, 0x1008),
+            (TRACE_MEM | TRACE_CHANGED, 3, 0x3008, 0x300c),
+            (TRACE_MEM_LOCAL, 3, 0x3000, 12),
+            (TRACE_MEM, 9, 0x4000, 0x4008), # an 8-byte access
+            (TRACE_MEM_LOCAL, 9, 0x4000, 4), # a local smaller than the access does not hold it
+        ], dtype=TRACE_RECORD)
+        tables = self.get_tables(lambda t: t.add_summary_records(records))
+        self.assertEqual(tables.alive_sites, ['ID7', 'ID7', 'ID8'])
+        self.assertEqual(tables.int_values, {'ID5': (-5, 3), 'ID6': (1, 2)})
+        self.assertEqual(tables.int_values_repeat, ['ID5'])
+        self.assertEqual(tables.mem_values['ID2'], [0x1004, 4, 0x1000, 16, True, False])
+        self.assertEqual(tables.mem_values['ID3'], [0x3008, 4, 0x3000, 12, False, True])
+        self.assertEqual(tables.mem_values_repeat, ['ID3'])
+        self.assertEqual(tables.mem_values['ID9'], [0x4000, 8, 0x4000, 8, False, False])
+
+    def test_region_index(self):
+        # same answers as the linear scans the index replaces, with overlapping regions
+        rng = random.Random(0)
+        mem_range_global = {}
+        for _ in range(50):
+            mem_range_global[rng.randrange(0, 400, 4)] = rng.choice([4, 8, 16, 64])
+        global_regions = GlobalRegions(mem_range_global)
+        local_regions = LocalRegions()
+        mem_range_local = []
+        for _ in range(2000):
+            if rng.random() < 0.5:
+                head, size = rng.randrange(1000, 1400, 4), rng.choice([4, 8, 16, 64])
+                mem_range_local.append([head, size])
+                local_regions.add(head, size)
+                continue
+            access_mem, access_size = rng.randrange(0, 1500, 2), rng.choice([1, 4, 8])
+            expected = None
+            for mem_head in mem_range_global:
+                if mem_head <= access_mem <= mem_head + mem_range_global[mem_head]-access_size:
+                    expected = (mem_head, mem_range_global[mem_head])
+                    break
+            self.assertEqual(global_regions.find(access_mem, access_size), expected)
+            expected = None
+            for mem_head, mem_size in reversed(mem_range_local):
+                if mem_head <= access_mem <= mem_head + mem_size-access_size:
+                    expected = (mem_head, mem_size)
+                    break
+            self.assertEqual(local_regions.find(access_mem, access_size), expected)
+
+    def test_run_instrumented(self):
+        tables = TraceTables()
+        ret, _ = run_instrumented(['sh', '-c', 'echo INST:1; echo INST:2; printf INST:3'], tables)
+        self.assertEqual(ret, 0)
+        self.assertEqual(tables.alive_sites, ['ID1', 'ID2', 'ID3'])
+        ret, reason = run_instrumented(['yes', 'INST:1'], TraceTables(), max_bytes=1 << 16)
+        self.assertNotEqual(ret, 0)
+        self.assertIn('exceeded', reason)
+
+    def test_empty(self):
+        tables = self.get_tables(lambda t: t.add_records(load_binary_trace('/nonexistent.trace')))
+        self.assertEqual(tables.alive_sites, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from synthesizer import *
+
+class TestScopeTree(unittest.TestCase):
+    def is_child_scope(self, src_scope, tgt_scope):
+        # the recursive walk the numbering replaces
+        for child in tgt_scope.children:
+            if child.id == src_scope.id:
+                return True
+            if self.is_child_scope(src_scope, child):
+                return True
+        return False
+
+    def test_is_child_scope(self):
+        rng = random.Random(0)
+        root = ScopeTree("Init")
+        nodes = [root]
+        for i in range(300):
+            node = ScopeTree(f'ID{i}')
+            node.parent = rng.choice(nodes[-20:]) # deep and wide
+            node.parent.children.append(node)
+            nodes.append(node)
+        root.number()
+        syn = Synthesizer(100)
+        for _ in range(5000):
+            src_scope, tgt_scope = rng.choice(nodes), rng.choice(nodes)
+            self.assertEqual(syn.is_child_scope(src_scope, tgt_scope), self.is_child_scope(src_scope, tgt_scope))
+        self.assertFalse(syn.is_child_scope(root, root))
+
+
+if __name__ == '__main__':
+    unittest.main()
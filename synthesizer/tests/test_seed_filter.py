@@ -0,0 +1,57 @@
+import unittest
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from seed_filter import *
+
+class TestSeedFilter(unittest.TestCase):
+    # the shape of a Csmith seed
+    src = (
+        "/* --- FORWARD DECLARATIONS --- */\n"
+        "static int32_t  func_1(void);\n"
+        "static int32_t g_2 = 0L;\n"
+        "static int32_t g_3[4] = {1, 2, 3, 4};\n"
+        "/* ------------------------------------------ */\n"
+        "static int32_t  func_1(void)\n"
+        "{ /* block id: 0 */\n"
+        "    int32_t l_5 = 1L;\n"
+        "    int32_t *l_6 = &g_2;\n"
+        "    (*l_6) = (l_5 << g_3[1]);\n"
+        "    return g_2;\n"
+        "}\n"
+        "int main (int argc, char* argv[])\n"
+        "{\n"
+        "    func_1();\n"
+        "    return 0;\n"
+        "}\n"
+    )
+
+    def test_count_constructs(self):
+        counts = count_constructs(self.src)
+        self.assertEqual(counts['function'], 1)
+        self.assertEqual(counts['array'], 2)
+        self.assertEqual(counts['divop'], 0)
+        self.assertGreater(counts['pointer'], 0)
+        self.assertGreater(counts['intop'], 0)
+        self.assertEqual(count_constructs(self.src.replace('func_1', 'main'), ['function']), {'function': 0})
+
+    def test_prefilter_seed(self):
+        src = self.src + ' ' * MIN_PROGRAM_SIZE
+        self.assertEqual(prefilter_seed(self.src), 'size')
+        self.assertIsNone(prefilter_seed(src))
+        self.assertIsNone(prefilter_seed(src, TargetUB.BufferOverflow))
+        self.assertEqual(prefilter_seed(src, TargetUB.DivideZero), 'divop')
+        self.assertIsNone(prefilter_seed(src.replace('<<', '/'), TargetUB.DivideZero))
+
+    def test_local_array(self):
+        # l_5 and l_6 are scalars, g_3 is global: nothing for StackToHeap to move
+        src = self.src + ' ' * MIN_PROGRAM_SIZE
+        self.assertEqual(count_constructs(src, ['local_array']), {'local_array': 0})
+        for ub in [TargetUB.DoubleFree, TargetUB.MemoryLeak, TargetUB.UseAfterFree]:
+            self.assertEqual(prefilter_seed(src, ub), 'local_array')
+        src = src.replace('int32_t l_5 = 1L;', 'int32_t l_5 = 1L;\n    int32_t l_7[2] = {0, 1};')
+        for ub in [TargetUB.DoubleFree, TargetUB.MemoryLeak, TargetUB.UseAfterFree]:
+            self.assertIsNone(prefilter_seed(src, ub))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from seed_yield import *
+from seed_filter import UB_CONSTRUCTS, CSMITH_REMOVES
+import tempfile, random
+
+class TestSeedYield(unittest.TestCase):
+    def test_profiles(self):
+        for ub in TargetUB:
+            if ub != TargetUB.ERROR:
+                self.assertEqual(csmith_profiles(ub)[0], '')
+        self.assertEqual(csmith_profiles(None), [''])
+
+    def test_profile_constructs(self):
+        # no profile takes away what its UB needs, or its seeds never give a mutant
+        for ub_name, profiles in CSMITH_UB_PROFILES.items():
+            for profile in profiles:
+                removed = [name for option in profile.split() for name in CSMITH_REMOVES.get(option, [])]
+                self.assertFalse(set(removed) & set(UB_CONSTRUCTS[ub_name]), (ub_name, profile))
+
+    def test_choose(self):
+        tracker = YieldTracker(['', 'a', 'b'], explore=0, rng=random.Random(0))
+        for _ in range(MIN_PROFILE_SEEDS * 3): # every profile is tried first
+            profile = tracker.choose()
+            tracker.record(profile, {'': 1, 'a': 0, 'b': 2}[profile], 10.0)
+        self.assertEqual([tracker.stats[p]['seeds'] for p in tracker.profiles], [MIN_PROFILE_SEEDS] * 3)
+        self.assertEqual(tracker.stats['a']['empty'], MIN_PROFILE_SEEDS)
+        self.assertEqual(tracker.choose(), 'b')
+        self.assertEqual(tracker.mutants_per_hour('b'), 720.0)
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'yield.json')
+            tracker = YieldTracker(['', 'a'], path, 'DoubleFree')
+            tracker.record('a', 2, 4.0)
+            tracker.save()
+            other = YieldTracker(['', 'a'], path, 'OutBound')
+            other.record('', 1, 1.0)
+            other.save()
+            tracker = YieldTracker(['', 'a'], path, 'DoubleFree')
+            self.assertEqual(tracker.stats['a'], {'seeds': 1, 'mutants': 2, 'empty': 0, 'seconds': 4.0})
+            self.assertEqual(tracker.stats['']['seeds'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
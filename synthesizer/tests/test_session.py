@@ -0,0 +1,38 @@
+import unittest
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from synthesizer import *
+import hashlib
+
+class TestSession(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = './tmpdir_session'
+        return super().setUp()
+    def tearDown(self) -> None:
+        if self._outcome.errors[-1][1] is None and len(self._outcome.result.failures) ==0:
+            if os.path.exists(self.tmp_dir):
+                shutil.rmtree(self.tmp_dir)
+        return super().tearDown()
+
+    def test_1(self):
+        # the DivideZero mutants of a session are those of synthesize_sources alone
+        src_code_file = os.path.abspath(os.path.join(os.path.dirname(__file__), 'testcases/dividebyzero/test1.c'))
+        oracle_file = os.path.abspath(os.path.join(os.path.dirname(__file__), 'testcases/dividebyzero/test1_oracle1.c'))
+        with open(oracle_file, 'rb') as f:
+            oracle_md5 = hashlib.md5(f.read().replace(b'\n', b'')).hexdigest()
+        ALL_TARGET_UB = [TargetUB.DivideZero, TargetUB.IntegerOverflow, TargetUB.UseUninit]
+        for _ in range(20): # due to randomness of synthesizer
+            syner = Synthesizer(100, self.tmp_dir, given_ALL_TARGET_UB=ALL_TARGET_UB[:1])
+            results = syner.synthesize_session(src_code_file, ALL_TARGET_UB)
+            self.assertEqual(set(results), {'DivideZero', 'IntegerOverflow', 'UseUninit'})
+            for ub_name, (mutants, mutants_info) in results.items():
+                self.assertEqual(len(mutants), len(mutants_info))
+                self.assertTrue(all(info['ub'] == ub_name for info in mutants_info))
+            for mut in results['DivideZero'][0]:
+                if hashlib.md5(mut.encode('utf-8').replace(b'\n', b'')).hexdigest() == oracle_md5:
+                    return
+        self.assertTrue(False)
+
+
+if __name__ == '__main__':
+    unittest.main()
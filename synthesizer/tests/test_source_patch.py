@@ -0,0 +1,103 @@
+import unittest
+import os, sys, re, random, pickle
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from source_patch import *
+
+class TestSourcePatch(unittest.TestCase):
+    src = (
+        "#define _INTOPL0 \n"
+        "#define _INTOPR0 \n"
+        "#define _MUTARR1 \n"
+        "int g_1[4];\n"
+        "int main() {\n"
+        "/*I:ID0:VARREF_INIT:int:l_5:*/\n"
+        "/*I:ID3:INSERTIONSITE:*/if (print_flag_inst[3]!=2) {print_flag_inst[3]++;}\n"
+        "l_5 = (l_5 _INTOPL0) + (1 _INTOPR0);/*I:ID4:VARREF_MEMORY:int:g_1[(l_5) _MUTARR1)]:*/\n"
+        "g_1[(l_5) _MUTARR1)] = l_5 + l_5 + l_5;\n"
+        "/*I:ID0:VARREF_FREE:int:l_6:*/\n"
+        "free_1(l_6);\n"
+        "free_1(l_7);\n"
+        "}\n"
+    )
+
+    def test_marker_index(self):
+        marks = MarkerIndex(self.src)
+        self.assertEqual(marks.sites[3], [(self.src.index('/*I:ID3:INSERTIONSITE:*/'), self.src.index('if (print'))])
+        self.assertEqual(marks.inits[0], self.src.index('/*I:ID0:VARREF_INIT:'))
+        self.assertEqual(marks.frees[0], self.src.index('/*I:ID0:VARREF_FREE:'))
+        self.assertEqual(len(marks.uses['_MUTARR1']), 2)
+        self.assertEqual(len(marks.defines['_INTOPR0']), 1)
+
+    def test_same_as_substitution(self):
+        # each edit gives what the whole-file substitutions of Synthesizer.insert gave
+        marks = MarkerIndex(self.src)
+        edits = [(s, e, '+5/*UBFUZZ*/') for s, e in marks.uses['_MUTARR1']]
+        self.assertEqual(splice(self.src, edits), re.sub(re.escape('_MUTARR1)'), '+5/*UBFUZZ*/)', self.src))
+        new = '#include <stdint.h>\nint32_t MUT_VAR = +(7)/*UBFUZZ*/;\n#define _INTOPR0 +(MUT_VAR) '
+        edits = [(s, e, new) for s, e in marks.defines['_INTOPR0']]
+        self.assertEqual(splice(self.src, edits), re.sub(re.escape('#define _INTOPR0 '), new, self.src))
+        free_index = self.src.find('free_', marks.frees[0])
+        first_half, second_half = self.src[:marks.frees[0]], self.src[marks.frees[0]:]
+        self.assertEqual(splice(self.src, [(free_index, free_index, '//UBFUZZ //')]),
+                         first_half + second_half.replace('free_', '//UBFUZZ //free_', 1))
+        edits = [(s, e, 'int l_5;//UBFUZZ /*I:') for s, e in marks.sites[3]]
+        init_index = self.src.find('l_5', marks.inits[0])
+        edits.append((init_index, init_index+3, 'UNINIT_a'))
+        init_index = self.src.find('l_5', init_index+3)
+        edits.append((init_index, init_index+3, 'UNINIT_a'))
+        first_half, second_half = self.src[:marks.inits[0]], self.src[marks.inits[0]:]
+        expected = first_half + second_half.replace('l_5', 'UNINIT_a', 2)
+        expected = expected.replace('/*I:ID3:INSERTIONSITE:*/', 'int l_5;//UBFUZZ /*I:')
+        self.assertEqual(splice(self.src, edits), expected)
+
+    def test_clean_base(self):
+        # patching the clean base is the same as cleaning the whole mutant
+        src = self.src + "int MUT_ARR_2 = 0;\ng_1[MUT_ARR_2+1+MUT_PTR_3] = 0;/*I:ID9:VARREF_ASSIGN:int:g_1:*/\n"
+        base = CleanBase(src)
+        self.assertEqual(base.patch([]), clean_source(src))
+        rng = random.Random(0)
+        for _ in range(500):
+            edits, last = [], 0
+            for _ in range(rng.randint(1, 4)):
+                start = rng.randint(last, len(src))
+                end = rng.randint(start, min(len(src), start+30))
+                edits.append((start, end, rng.choice(['', 'x', '\n', '/*I:', '+1/*UBFUZZ*/', 'MUT_ARR_5+'])))
+                last = end
+            self.assertEqual(base.patch(edits), clean_source(splice(src, edits)))
+            self.assertEqual(base.digest(base.clean_edits(edits)), mutant_digest(base.patch(edits)))
+        # an edit inside an instrumented comment does not change the mutant
+        marks = MarkerIndex(src)
+        start, end = marks.uses['_MUTARR1'][0]
+        self.assertEqual(base.clean_edits([(start, end, '+5/*UBFUZZ*/')]), [])
+
+    def test_diff_edit(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            start = rng.randint(0, len(self.src))
+            end = rng.randint(start, len(self.src))
+            text = self.src[:start] + rng.choice(['', 'x', self.src[start:end], '/0']) + self.src[end:]
+            edit = diff_edit(self.src, text)
+            self.assertEqual(splice(self.src, [edit]), text)
+            self.assertLessEqual(len(edit[2]), len(text) - len(self.src) + (end - start))
+
+    def test_mutant(self):
+        base = CleanBase(self.src)
+        marks = MarkerIndex(self.src)
+        edits = base.clean_edits([(s, e, 'int UNINIT_a;') for s, e in marks.sites[3]] + [(s, e, '+5') for s, e in marks.uses['_MUTARR1']])
+        mutant = Mutant(base.clean, edits, base.digest(edits))
+        self.assertEqual(mutant.materialize(), base.patch([(s, e, 'int UNINIT_a;') for s, e in marks.sites[3]] + [(s, e, '+5') for s, e in marks.uses['_MUTARR1']]))
+        self.assertEqual(mutant.digest, mutant_digest(mutant.materialize()))
+        self.assertEqual(mutant.count('UNINIT'), mutant.materialize().count('UNINIT'))
+        self.assertEqual(splice(base.clean, [mutant.span_edit()]), mutant.materialize())
+        copy = pickle.loads(pickle.dumps(mutant))
+        self.assertEqual(copy, mutant)
+        self.assertEqual(materialize(copy), mutant.materialize())
+        self.assertEqual(materialize('int a;'), 'int a;')
+
+    def test_overlap(self):
+        with self.assertRaises(ValueError):
+            splice(self.src, [(0, 5, 'a'), (3, 6, 'b')])
+
+
+if __name__ == '__main__':
+    unittest.main()
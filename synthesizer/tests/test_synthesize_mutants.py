@@ -0,0 +1,78 @@
+import unittest
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from synthesizer import *
+
+class FixtureSynthesizer(Synthesizer):
+    # the seed is instrumented already and its trace is given: no clang tools and no run
+    trace = "INST:1\n"
+
+    def instrument(self, filename):
+        tables = TraceTables()
+        tables.add_text(self.trace)
+        tables.finish()
+        self.analyze(filename, tables)
+
+class TestSynthesizeMutants(unittest.TestCase):
+    # each free of an alive function is a MemoryLeak candidate
+    src = (
+        "int main(void) {\n"
+        "/*I:ID0:FUNCTIONENTER:*/\n"
+        "/*I:ID1:INSERTIONSITE:*/if (print_flag_inst[1]!=2) {print_flag_inst[1]++;}\n"
+        "/*I:ID2:VARREF_FREE:int *:l_2:*/\n"
+        "free_1(l_2);\n"
+        "/*I:ID3:VARREF_FREE:int *:l_3:*/\n"
+        "free_1(l_3);\n"
+        "/*I:ID4:VARREF_FREE:int *:l_4:*/\n"
+        "free_1(l_4);\n"
+        "/*I:ID5:VARREF_FREE:int *:l_5:*/\n"
+        "free_1(l_5);\n"
+        "return 0;\n"
+        "}\n"
+    )
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.seed = os.path.join(self.tmp_dir, 'seed.c')
+        with open(self.seed, 'w') as f:
+            f.write(self.src)
+        return super().setUp()
+
+    def synthesize(self, mutated_num=-1, **kwargs):
+        syner = FixtureSynthesizer(100, self.tmp_dir, config=SynthesizerConfig(target_ubs=(TargetUB.MemoryLeak,)))
+        return syner.synthesize_sources(self.seed, mutated_num, **kwargs)
+
+    def test_mutated_num(self):
+        all_mutants = self.synthesize()
+        self.assertEqual(len(all_mutants), 4)
+        self.assertEqual(len(set(all_mutants)), 4)
+        picked = set()
+        for _ in range(20): # candidates are visited in random order
+            mutants = self.synthesize(2)
+            self.assertEqual(len(mutants), 2)
+            self.assertEqual(len(set(mutants)), 2)
+            self.assertTrue(set(mutants) <= set(all_mutants))
+            picked.update(mutants)
+        self.assertGreater(len(picked), 2)
+        # fewer candidates than mutated_num: all of them
+        self.assertEqual(sorted(self.synthesize(10)), sorted(all_mutants))
+
+    def test_dedup(self):
+        # another record of ID2 edits the same free as the first one: one mutant for both
+        with open(self.seed, 'w') as f:
+            f.write(self.src.replace("return 0;", "/*I:ID2:VARREF_FREE:int *:l_2:*/\nfree_1(l_6);\nreturn 0;"))
+        mutants = self.synthesize()
+        self.assertEqual(len(mutants), 4)
+        self.assertEqual(len(set(mutants)), 4)
+        self.assertEqual(self.synthesize(as_bytes=True), [mutant.encode('utf-8') for mutant in mutants])
+        self.assertEqual([mutant.materialize() for mutant in self.synthesize(delta=True)], mutants)
+        # digests in `seen` are skipped across calls
+        seen = set()
+        self.assertEqual(self.synthesize(as_bytes=True, seen=seen), [mutant.encode('utf-8') for mutant in mutants])
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(self.synthesize(seen=seen), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
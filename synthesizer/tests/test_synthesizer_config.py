@@ -0,0 +1,34 @@
+import unittest
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import synthesizer
+from synthesizer import *
+import dataclasses
+
+class TestSynthesizerConfig(unittest.TestCase):
+    def test_config(self):
+        config = SynthesizerConfig(target_ubs=[TargetUB.DoubleFree])
+        self.assertEqual(config.target_ubs, (TargetUB.DoubleFree,))
+        self.assertIn('--mutate-prob 100', config.tool_stacktoheap)
+        self.assertEqual(SynthesizerConfig(target_ubs=[TargetUB.OutBound]).tool_stacktoheap, TOOL_STACKTOHEAP)
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            config.target_ubs = (TargetUB.OutBound,)
+        with self.assertRaises(ValueError):
+            SynthesizerConfig(target_ubs=[])
+        with self.assertRaises(ValueError):
+            SynthesizerConfig(target_ubs=[TargetUB.ERROR])
+
+    def test_no_globals(self):
+        # synthesizers of different targets coexist and leave the module config alone
+        all_target_ub, tool_stacktoheap = list(synthesizer.ALL_TARGET_UB), synthesizer.TOOL_STACKTOHEAP
+        a = Synthesizer(100, given_ALL_TARGET_UB=[TargetUB.DivideZero], given_TOOL_STACKTOHEAP='stacktoheap --mutate-prob 7')
+        b = Synthesizer(100, config=SynthesizerConfig(target_ubs=(TargetUB.OutBound, TargetUB.UseUninit)))
+        self.assertEqual(a.target_ubs, [TargetUB.DivideZero])
+        self.assertEqual(a.config.tool_stacktoheap, 'stacktoheap --mutate-prob 7')
+        self.assertEqual(b.target_ubs, [TargetUB.OutBound, TargetUB.UseUninit])
+        self.assertEqual(synthesizer.ALL_TARGET_UB, all_target_ub)
+        self.assertEqual(synthesizer.TOOL_STACKTOHEAP, tool_stacktoheap)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import os, sys, time, tempfile
+from concurrent.futures import Future
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import ubgen
+from ubgen import *
+
+def fake_synthesize_seed(target_ub, seed=None, remove_seed=False, profile=None, seed_seconds=0.0):
+    # two mutants per seed, unique across seeds and workers, without Csmith or clang
+    time.sleep(0.5)
+    if seed is not None and remove_seed:
+        os.remove(seed)
+    name = f'{os.getpid()}_{time.monotonic_ns()}'
+    mutants = [f'int main(void) {{ return {i}; }} /* {name} */\n' for i in range(2)]
+    return SeedResult(f'{name}.c', mutants, [{'ub': target_ub.name}] * 2, name, Counter(), profile, 0.0)
+
+def fake_generate_csmith_src(seed_dir):
+    # an empty seed file in seed_dir, without Csmith
+    def generate_csmith_src(target_ub=None, rejects=None, profile=''):
+        time.sleep(0.01)
+        with NamedTemporaryFile(suffix=".c", dir=seed_dir, delete=False) as f:
+            return f.name
+    return generate_csmith_src
+
+def failing_generate_csmith_src(target_ub=None, rejects=None, profile=''):
+    raise RuntimeError('csmith is broken')
+
+class TestUbgen(unittest.TestCase):
+    def setUp(self) -> None:
+        self.out = tempfile.mkdtemp()
+        self.seed_dir = tempfile.mkdtemp()
+        generate_csmith_src = ubgen.generate_csmith_src
+        ubgen.generate_csmith_src = fake_generate_csmith_src(self.seed_dir) # the producer threads run in this process
+        self.addCleanup(setattr, ubgen, 'generate_csmith_src', generate_csmith_src)
+        self.addCleanup(shutil.rmtree, self.seed_dir)
+        synthesize_seed = ubgen.synthesize_seed
+        ubgen.synthesize_seed = fake_synthesize_seed # forked workers inherit it
+        self.addCleanup(setattr, ubgen, 'synthesize_seed', synthesize_seed)
+        self.addCleanup(shutil.rmtree, self.out)
+        return super().setUp()
+
+    def test_jobs(self):
+        # the first `jobs` seeds run in parallel, one per worker
+        self.assertEqual(run_pool(TargetUB.DivideZero, self.out, 3, 6), 6)
+        pids = {name.split('_')[2] for name in os.listdir(self.out)}
+        self.assertEqual(len(pids), 3)
+
+    def test_count(self):
+        self.assertEqual(run_pool(TargetUB.DivideZero, self.out, 2, 5), 5)
+        self.assertEqual(len(os.listdir(self.out)), 5)
+        # without a count, one seed with mutants is enough
+        shutil.rmtree(self.out)
+        os.mkdir(self.out)
+        self.assertEqual(run_pool(TargetUB.DivideZero, self.out, 1), 2)
+
+    def test_count_seed_queue(self):
+        # every seed file is removed: by a worker, when cancelled, or by close()
+        seeds = SeedQueue(4, 2, TargetUB.DivideZero)
+        try:
+            self.assertEqual(run_pool(TargetUB.DivideZero, self.out, 2, 7, seeds=seeds), 7)
+        finally:
+            seeds.close()
+        self.assertEqual(len(os.listdir(self.out)), 7)
+        self.assertEqual(os.listdir(self.seed_dir), [])
+
+    def test_seed_queue_error(self):
+        ubgen.generate_csmith_src = failing_generate_csmith_src
+        seeds = SeedQueue(2, 1)
+        seeds.start()
+        with self.assertRaisesRegex(RuntimeError, 'csmith is broken'):
+            seeds.get()
+        seeds.close()
+
+    def test_seed_queue_close(self):
+        seeds = SeedQueue(3, 2)
+        seeds.start()
+        src, profile, seconds = seeds.get()
+        self.assertEqual((os.path.dirname(src), profile), (self.seed_dir, ''))
+        while not seeds.queue.full():
+            time.sleep(0.01)
+        seeds.close() # the queued seeds and those waiting to be queued
+        self.assertEqual(os.listdir(self.seed_dir), [os.path.basename(src)])
+
+    def test_cancel_pending(self):
+        srcs = {}
+        for name in ['queued', 'running', 'done']:
+            future = Future()
+            srcs[future] = os.path.join(self.seed_dir, name)
+            open(srcs[future], 'w').close()
+        queued, running, done = srcs
+        running.set_running_or_notify_cancel()
+        done.set_result(None)
+        cancel_pending({queued, running, done, Future()}, srcs)
+        self.assertTrue(queued.cancelled())
+        self.assertEqual(sorted(os.listdir(self.seed_dir)), ['done', 'running'])
+        self.assertEqual(list(srcs), [running, done])
+
+    def test_store_mutants(self):
+        result = SeedResult('seed.c', ['a\n', 'a\n', 'b\n', 'c\n'], [{}] * 4, '', Counter(), '', 0.0)
+        seen = DigestSet()
+        self.assertEqual(store_mutants(result, self.out, 2, seen), 2) # the second `a` is a duplicate
+        self.assertEqual(sorted(os.listdir(self.out)), ['mutated_0_seed.c', 'mutated_1_seed.c'])
+        self.assertEqual(len(seen), 2)
+        shutil.rmtree(self.out)
+        os.mkdir(self.out)
+        self.assertEqual(store_mutants(result, self.out, None, seen), 1) # only `c` is new
+        with open(os.path.join(self.out, 'mutated_0_seed.c')) as f:
+            self.assertEqual(f.read(), 'c\n')
+        self.assertEqual(store_mutants(result, self.out, 0), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,16 @@
 #!/usr/bin/env python
-import argparse, os, requests, zipfile, shutil
+import argparse, os, requests, zipfile, shutil, time
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from queue import Queue, Full, Empty
+from threading import Thread, Event
 from pathlib import Path
 from synthesizer.synthesizer import Synthesizer
+from synthesizer.seed_filter import prefilter_seed
+from synthesizer.seed_yield import YieldTracker, csmith_profiles
+from synthesizer.mutant_store import DigestSet, CorpusStore, PackWriter, mutant_digest, materialize
 from synthesizer.config import *
-from tempfile import NamedTemporaryFile, TemporaryDirectory, TemporaryFile
+from tempfile import NamedTemporaryFile, TemporaryDirectory, TemporaryFile, mkdtemp
 
 def run_cmd(cmd, timeout, out_file):
     ret = os.system(f"ASAN_OPTIONS=detect_leaks=0,detect_stack_use_after_return=1 timeout {timeout} {cmd} > {out_file} 2>&1");
@@ -55,9 +62,51 @@ def check_available_csmith() -> bool:
         ret = os.system(f"{CC} {COMPILE_ARGS} {tmp_src.name} -o /dev/null -w")
         if ret != 0:
             return False
-        return True
+    build_csmith_pch()
+    return True
 
-def generate_csmith_src() -> str:
+def build_csmith_pch():
+    # Precompile csmith.h once per install; every seed check, instrumented
+    # build and clang-tool pass otherwise reparses it. config.py picks the
+    # PCHs up from the next run on. A PCH that fails a trial compile is
+    # dropped, so the compiles fall back to plain -I.
+    header = f'{CSMITH_INCLUDE}/csmith.h'
+    if not os.path.exists(header):
+        return
+    os.makedirs(CSMITH_PCH_DIR, exist_ok=True)
+    builds = {} # name: (build command, trial compile)
+    if 'clang' in CC:
+        builds['cc'] = (f'{CC} -x c-header -w {INCLUDE_ARGS} {header} -o {{pch}}',
+                        f'{CC} -w {INCLUDE_ARGS} -include-pch {{pch}} {{src}} -o /dev/null')
+        builds['check'] = (f'{CC} -x c-header -w {INCLUDE_ARGS} {CSMITH_CHECK_OPTIONS} {header} -o {{pch}}',
+                           f'{CC} -w {INCLUDE_ARGS} {CSMITH_CHECK_OPTIONS} -include-pch {{pch}} {{src}} -o /dev/null')
+    if os.path.exists(TOOL_PIPELINE):
+        builds['tool'] = (f'{TOOL_PIPELINE} --emit-pch={{pch}} {header} -- -w {INCLUDE_ARGS}',
+                          f'{TOOL_PIPELINE} {{src}} --mode=init -- -w {INCLUDE_ARGS} -include-pch {{pch}}')
+    with NamedTemporaryFile(suffix=".c", mode="w", delete=True) as tmp_src:
+        for name, (build, trial) in builds.items():
+            pch = csmith_pch_path(name)
+            if os.path.exists(pch) and os.path.getmtime(pch) >= os.path.getmtime(header):
+                continue
+            tmp_pch = f'{pch}.{os.getpid()}'
+            # rewritten for each trial, the pipeline instruments it in place
+            with open(tmp_src.name, 'w') as f:
+                f.write('#include "csmith.h"\nint main(void) { return 0; }\n')
+            ret = run_cmd(build.format(pch=tmp_pch), COMPILER_TIMEOUT, "/dev/null")
+            if ret == 0:
+                ret = run_cmd(trial.format(pch=tmp_pch, src=tmp_src.name), COMPILER_TIMEOUT, "/dev/null")
+            if ret == 0:
+                os.replace(tmp_pch, pch) # atomic for concurrent ubgen runs
+            elif os.path.exists(tmp_pch):
+                os.remove(tmp_pch)
+
+def generate_csmith_src(target_ub: TargetUB=None, rejects: Counter=None, profile: str='') -> str:
+    # run Csmith, with the extra options of `profile`, until a seed passes the
+    # checks, cheapest first: the static ones of prefilter_seed for target_ub,
+    # then the sanitizer compile and run. The reason of every rejected seed is
+    # counted in `rejects`.
+    if rejects is None:
+        rejects = Counter()
     src = NamedTemporaryFile(suffix=".c", mode="w", delete=False)
     src.close()
     src = src.name
@@ -68,25 +117,212 @@ def generate_csmith_src() -> str:
         with NamedTemporaryFile(suffix="_csmith.exe", mode="w", delete=False) as f:
             f.close()
             csmith_exe = f.name
-            cmd = f"{CSMITH_BIN} {CSMITH_USER_OPTIONS} --output {src}"
+            cmd = f"{CSMITH_BIN} {CSMITH_USER_OPTIONS} {profile} --output {src}"
             ret = run_cmd(cmd, CSMITH_TIMEOUT, "/dev/null")
             if ret != 0:
+                rejects['csmith'] += 1
                 continue
-            if os.path.getsize(src) >= MIN_PROGRAM_SIZE:
-                cmd = f"{CC} {COMPILE_ARGS} {CSMITH_CHECK_OPTIONS} {src} -o {csmith_exe}"
-                ret = run_cmd(cmd, COMPILER_TIMEOUT, "/dev/null")
-                if ret != 0:
-                    continue
-                ret = run_cmd(csmith_exe, PROG_TIMEOUT, "/dev/null")
-                if ret != 0:
-                    continue
-                break
-            else:
+            with open(src, errors='replace') as f:
+                reason = prefilter_seed(f.read(), target_ub)
+            if reason is not None:
+                rejects[reason] += 1
+                continue
+            cmd = f"{CC} {CHECK_COMPILE_ARGS} {CSMITH_CHECK_OPTIONS} {src} -o {csmith_exe}"
+            ret = run_cmd(cmd, COMPILER_TIMEOUT, "/dev/null")
+            if ret != 0:
+                rejects['compile'] += 1
+                continue
+            ret = run_cmd(csmith_exe, PROG_TIMEOUT, "/dev/null")
+            if ret != 0:
+                rejects['run'] += 1
                 continue
+            break
     if Path(csmith_exe).exists():
         os.remove(csmith_exe)
     return src
-    
+
+class SeedQueue:
+    # `producers` threads keep up to `depth` Csmith seeds that passed the checks
+    # of generate_csmith_src ready, off the critical path of the synthesis
+    # workers; Csmith and the checks run as subprocesses, so threads suffice.
+    # get() returns a seed file, the Csmith profile chosen by `tracker` for it
+    # and the seconds its generation took; whoever gets it removes the file.
+    # An error of a producer is raised by get(). The threads only run after
+    # start(), so that a process pool can fork its workers before.
+    def __init__(self, depth: int, producers: int, target_ub: TargetUB=None, tracker: YieldTracker=None) -> None:
+        self.queue = Queue(maxsize=depth)
+        self.stopped = Event()
+        self.target_ub = target_ub
+        self.tracker = tracker
+        self.producer_rejects = [Counter() for _ in range(producers)] # one per thread, no lock needed
+        self.threads = []
+
+    def start(self):
+        if self.threads:
+            return
+        self.threads = [Thread(target=self.produce, args=(rejects,), daemon=True) for rejects in self.producer_rejects]
+        for thread in self.threads:
+            thread.start()
+
+    @property
+    def rejects(self) -> Counter:
+        return sum(self.producer_rejects, Counter())
+
+    def produce(self, rejects):
+        while not self.stopped.is_set():
+            profile = self.tracker.choose() if self.tracker is not None else ''
+            start = time.monotonic() # Csmith and the checks are single-threaded subprocesses
+            try:
+                src = generate_csmith_src(self.target_ub, rejects, profile)
+                seed = (src, profile, time.monotonic() - start)
+            except Exception as e: # queued for get(), which would wait forever otherwise
+                seed = e
+            while not self.stopped.is_set():
+                try:
+                    self.queue.put(seed, timeout=1)
+                    break
+                except Full:
+                    continue
+            else:
+                if not isinstance(seed, Exception):
+                    os.remove(src)
+            if isinstance(seed, Exception):
+                return
+
+    def get(self):
+        seed = self.queue.get()
+        if isinstance(seed, Exception):
+            raise seed
+        return seed
+
+    def close(self):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+        while True:
+            try:
+                seed = self.queue.get_nowait()
+            except Empty:
+                break
+            if not isinstance(seed, Exception):
+                os.remove(seed[0])
+
+# what synthesize_seed returns: the seed's file name, the mutants, as edits of
+# the cleaned seed, what each mutant changed, the seed's digest, the Csmith seeds
+# rejected on the way by reason, the Csmith profile of the seed (None for a
+# given seed) and the wall-clock seconds it took, including generating the seed.
+# Wall time, as in SeedQueue, since most of the work is done by the instrument
+# server, whose CPU time is neither ours nor that of a waited-for child
+SeedResult = namedtuple('SeedResult', ['realname', 'mutants', 'infos', 'seed_digest', 'rejects', 'profile', 'seconds'])
+
+def synthesize_seed(target_ub: TargetUB, seed: Path=None, remove_seed: bool=False, profile: str=None,
+                    seed_seconds: float=0.0) -> SeedResult:
+    # one seed end to end; every call gets its own temp directory and Synthesizer
+    # so that it can run in a worker process. Without a seed, a Csmith seed is
+    # generated with `profile`; it is removed at the end, as is the given seed
+    # if remove_seed. seed_seconds is what generating a given seed took.
+    start = time.monotonic()
+    tmp_dir = mkdtemp()
+    rejects = Counter()
+    if seed is None:
+        profile = profile or ''
+        src = generate_csmith_src(target_ub, rejects, profile)
+    else:
+        src = str(seed)
+    mutants, infos = [], []
+    with open(src, 'rb') as f:
+        seed_digest = mutant_digest(f.read()).hex()
+    try:
+        SYNER = Synthesizer(prob=100, tmp_dir=tmp_dir, config=SynthesizerConfig(target_ubs=(target_ub,)))
+        mutants = SYNER.synthesize_sources(src, MUTATE_NUM, delta=True)
+        infos = SYNER.mutants_info
+    except Exception as e:
+        print(f'UBGen failed with {e}')
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if seed is None or remove_seed:
+        os.remove(src)
+    seconds = seed_seconds + time.monotonic() - start
+    return SeedResult(os.path.basename(src), mutants, infos, seed_digest, rejects, profile, seconds)
+
+def store_mutants(result: SeedResult, out, limit=None, seen: DigestSet=None) -> int:
+    # write at most `limit` mutants of a synthesize_seed result into `out`, a
+    # directory, a CorpusStore or a PackWriter, skipping those already in `seen`
+    realname, seed_digest = result.realname, result.seed_digest
+    stored = 0
+    for mutant, info in zip(result.mutants, result.infos):
+        if limit is not None and stored >= limit:
+            break
+        digest = mutant_digest(mutant)
+        if seen is not None and not seen.add(digest):
+            continue
+        if isinstance(out, CorpusStore):
+            if not out.put(mutant, digest, seed=seed_digest, **info):
+                continue
+        elif isinstance(out, PackWriter):
+            out.put(mutant, digest, seed=seed_digest, **info)
+        else:
+            with open(os.path.join(out, f'mutated_{stored}_{realname}'), 'w') as f:
+                f.write(materialize(mutant))
+        stored += 1
+    return stored
+
+def cancel_pending(pending, srcs: dict):
+    # cancel the futures in `pending` that did not start yet and remove the
+    # seed files `srcs` holds for them, which no worker will remove
+    for future in pending:
+        if future.cancel() and future in srcs:
+            os.remove(srcs.pop(future))
+
+def run_pool(target_ub: TargetUB, out, jobs: int, count: int=None, seen: DigestSet=None, seeds: SeedQueue=None,
+             rejects: Counter=None, tracker: YieldTracker=None) -> int:
+    # keep `jobs` seeds in flight until `count` mutants are stored in `out`,
+    # or, without `count`, until one seed produced mutants. Seeds come from
+    # `seeds` if given, otherwise each worker generates its own with the
+    # Csmith profile `tracker` chooses and the Csmith seeds it rejected are
+    # counted in `rejects`. The yield of every seed is recorded in `tracker`.
+    def submit(own_seed=False):
+        if seeds is None or own_seed:
+            profile = tracker.choose() if tracker is not None else ''
+            return pool.submit(synthesize_seed, target_ub, profile=profile)
+        src, profile, seed_seconds = seeds.get()
+        future = pool.submit(synthesize_seed, target_ub, src, True, profile, seed_seconds)
+        srcs[future] = src
+        return future
+    generated = 0
+    srcs = {} # the seed files of the futures of `seeds`, removed by the workers once they run
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        # the first seeds are the workers' own: the first submit forks all
+        # workers, and only then the producer threads of `seeds` may start
+        pending = {submit(own_seed=True) for _ in range(jobs)}
+        if seeds is not None:
+            seeds.start()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                srcs.pop(future, None)
+                limit = None if count is None else max(count - generated, 0)
+                result = future.result()
+                if rejects is not None:
+                    rejects.update(result.rejects)
+                if tracker is not None:
+                    tracker.record(result.profile, len(result.mutants), result.seconds)
+                stored = store_mutants(result, out, limit, seen)
+                generated += stored
+                print(f'{stored} mutants generated and stored in `{out}`')
+                if stored == 0 and count is None:
+                    print('try again...')
+            finished = generated >= count if count is not None else generated > 0
+            if finished:
+                break
+            while len(pending) < jobs:
+                pending.add(submit())
+        # the seeds still waiting in the pool are discarded; leaving the pool
+        # waits for those already running, so that their workers remove their
+        # temp directory and seed file, and drops their mutants
+        cancel_pending(pending, srcs)
+    return generated
+
 
 if __name__=='__main__':
     parser = argparse.ArgumentParser(description="Sythesize programs with undefined behaviors.")
@@ -104,6 +340,23 @@ if __name__=='__main__':
                         ")
     parser.add_argument("--out", type=Path, required=True, help="The output directory to store the synthesized programs.")
     parser.add_argument("--seed", type=Path, required=False, help="Specify the seed C program to inject UB.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of seeds processed in parallel (default: 1).")
+    parser.add_argument("--producers", type=int, default=0, help="Number of threads generating and checking Csmith seeds ahead of \
+                            the synthesis workers (default: 0, every worker generates its own seed).")
+    parser.add_argument("--prefetch-depth", type=int, required=False, help="Number of checked Csmith seeds kept ready by --producers \
+                            (default: 2 * --jobs).")
+    parser.add_argument("--yield-file", type=Path, required=False, help="Load and save the mutants per hour of each Csmith \
+                            option profile of the UB in this JSON file, so that later runs start with the most productive profile.")
+    parser.add_argument("--count", type=int, required=False, help="Keep generating until this many mutants are stored in --out. \
+                            By default, UBGen stops after the first seed that yields mutants.")
+    parser.add_argument("--out-format", choices=["files", "store", "pack"], default="files", help="files: one `mutated_<n>_<seed>.c` per mutant (default). \
+                            store: content-addressed, `<out>/<digest[:2]>/<digest>.c` plus `<out>/index.jsonl` recording the seed, \
+                            UB, site and replacement of each mutant; mutants already in the store are skipped. \
+                            pack: all mutants appended to `<out>/mutants.pack`, each as an edit of its cleaned seed, with the same records as store.")
+    parser.add_argument("--pack-compression", choices=["none", "gzip", "zstd"], default="none", help="Compression of a new pack \
+                            (default: none); zstd needs the `zstandard` module.")
+    parser.add_argument("--dedup-file", type=Path, required=False, help="Skip mutants whose digest is in this file and append the digests \
+                            of stored ones, so that mutants are unique across seeds and runs.")
 
     args = parser.parse_args()
 
@@ -111,45 +364,53 @@ if __name__=='__main__':
     if target_ub == TargetUB.ERROR:
         print(f"Invalid undefined behavior type: {args.ub}")
         exit(1)
-    if has_overlap([TargetUB.DoubleFree, TargetUB.MemoryLeak], ALL_TARGET_UB):
-        TOOL_STACKTOHEAP = f'{DYNAMIC_ANALYZER}/tool-stacktoheap --mutate-prob 100' # free statements will only be inserted with p=100
+    if args.jobs < 1:
+        print(f"--jobs must be positive, got {args.jobs}")
+        exit(1)
+    if args.producers < 0 or (args.prefetch_depth is not None and args.prefetch_depth < 1):
+        print("--producers must not be negative and --prefetch-depth must be positive")
+        exit(1)
 
     
     check_available_csmith()
 
     args.out.mkdir(parents=True, exist_ok=True)
+    seen = DigestSet(args.dedup_file) # without --dedup-file, mutants are still unique within this run
+    if args.out_format == "store":
+        out = CorpusStore(args.out)
+    elif args.out_format == "pack":
+        compression = None if args.pack_compression == "none" else args.pack_compression
+        suffix = {None: '', 'gzip': '.gz', 'zstd': '.zst'}[compression]
+        out = PackWriter(args.out / f'mutants.pack{suffix}', compression)
+    else:
+        out = args.out
 
-    while True:
-        with TemporaryDirectory() as tmp_dir:
-            SYNER = Synthesizer(prob=100, tmp_dir=tmp_dir, given_ALL_TARGET_UB=[target_ub])
-            if args.seed is not None:
-                if not os.path.exists(args.seed):
-                    print(f'The seed file `{args.seed}` does not exist!')
-                    exit(1)
-                
-                if not str(args.seed).endswith(".c"):
-                    print(f'The seed file `{args.seed}` must end with `.c`!')
-                    exit(1)
-                src = str(args.seed)
-            else:
-                src = generate_csmith_src()
-            mutated_files = []
-            try:
-                mutated_files = SYNER.synthesizer(src, MUTATE_NUM)
-            except Exception as e:
-                print(f'UBGen failed with {e}')
-            
-            for mutated_file in mutated_files:
-                shutil.copy(mutated_file, args.out)
-                os.remove(mutated_file)
-            
-            print(f'{len(mutated_files)} mutants generated and stored in `{args.out}`')
-            if args.seed is not None:
-                break
-            os.remove(src)
-            if len(mutated_files) == 0:
-                print('try again...')
-                continue
-        break
-
-
+    if args.seed is not None:
+        if not os.path.exists(args.seed):
+            print(f'The seed file `{args.seed}` does not exist!')
+            exit(1)
+        
+        if not str(args.seed).endswith(".c"):
+            print(f'The seed file `{args.seed}` must end with `.c`!')
+            exit(1)
+        stored = store_mutants(synthesize_seed(target_ub, args.seed), out, args.count, seen)
+        print(f'{stored} mutants generated and stored in `{args.out}`')
+    else:
+        seeds = None
+        rejects = Counter()
+        tracker = YieldTracker(csmith_profiles(target_ub), args.yield_file, target_ub.name)
+        if args.producers > 0:
+            seeds = SeedQueue(args.prefetch_depth or 2 * args.jobs, args.producers, target_ub, tracker)
+        try:
+            run_pool(target_ub, out, args.jobs, args.count, seen, seeds, rejects, tracker)
+        finally:
+            if seeds is not None:
+                seeds.close()
+                rejects.update(seeds.rejects)
+            tracker.save()
+        if rejects:
+            print(f'Csmith seeds rejected: {dict(rejects.most_common())}')
+        print(f'Yield of the Csmith profiles:\n{tracker.summary()}')
+    seen.close()
+    if isinstance(out, (CorpusStore, PackWriter)):
+        out.close()